@@ -0,0 +1,16 @@
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def project_test_settings(django_test_environment):
+    """Временный кеш, как у manage.py test, и миниатюры без потоков.
+
+    Тесты с transaction=True выполняют on_commit, и фоновая запись
+    миниатюр иначе пережила бы тест.
+    """
+    from django.test.utils import override_settings
+
+    from core.runner import temporary_cache
+
+    with temporary_cache(), override_settings(POST_THUMBNAILS_ASYNC=False):
+        yield
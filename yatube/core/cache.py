@@ -0,0 +1,270 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Диапазон INTEGER в SQLite; большие числа хранятся через pickle.
+INT_MIN = -2 ** 63
+INT_MAX = 2 ** 63 - 1
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        expires REAL,
+        accessed REAL NOT NULL,
+        size INTEGER NOT NULL
+    ) WITHOUT ROWID''',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+    '''CREATE TABLE IF NOT EXISTS cache_stats (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        entries INTEGER NOT NULL,
+        size INTEGER NOT NULL
+    )''',
+    'INSERT OR IGNORE INTO cache_stats VALUES (0, 0, 0)',
+    '''CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN
+        UPDATE cache_stats SET entries = entries + 1, size = size + NEW.size;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN
+        UPDATE cache_stats SET entries = entries - 1, size = size - OLD.size;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache
+    BEGIN
+        UPDATE cache_stats SET size = size - OLD.size + NEW.size;
+    END''',
+)
+
+
+@contextmanager
+def immediate(connection):
+    """Транзакция, сразу берущая блокировку записи в файле."""
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        yield connection
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    connection.execute('COMMIT')
+
+
+class SQLiteCache(BaseCache):
+    """Кеш в файле SQLite в режиме WAL, общий для всех процессов хоста.
+
+    Числа в пределах INTEGER хранятся как есть, и incr над ними — один
+    UPDATE; остальные числа хранятся через pickle.
+    Объем и число записей ведут триггеры в таблице cache_stats; при
+    превышении MAX_SIZE или MAX_ENTRIES вытесняются давно не читанные
+    записи. Время чтения обновляется не чаще раза в ACCESS_RESOLUTION
+    секунд, чтобы чтения почти не писали в файл.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = int(options.get('MAX_SIZE', 64 * 1024 * 1024))
+        self._access_resolution = float(options.get('ACCESS_RESOLUTION', 1))
+        self._mmap_size = int(options.get('MMAP_SIZE', self._max_size * 2))
+        self._local = threading.local()
+
+    @property
+    def _connection(self):
+        # Соединение SQLite нельзя делить между потоками и после fork.
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            # Без этого INSERT OR REPLACE не вызывает триггер удаления
+            # и cache_stats расходится с таблицей.
+            connection.execute('PRAGMA recursive_triggers=ON')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(f'PRAGMA mmap_size={self._mmap_size}')
+            with immediate(connection):
+                for statement in SCHEMA:
+                    connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = pid
+        return self._local.connection
+
+    def _encode(self, value):
+        if type(value) is int and INT_MIN <= value <= INT_MAX:
+            return value
+        return sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    def _decode(self, value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _size(self, key, value):
+        return len(key) + (8 if isinstance(value, int) else len(value))
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _write(self, connection, key, value, timeout, now):
+        value = self._encode(value)
+        connection.execute(
+            'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)',
+            (key, value, self.get_backend_timeout(timeout), now,
+             self._size(key, value)),
+        )
+
+    def _fetch(self, keys, now):
+        placeholders = ', '.join('?' * len(keys))
+        rows = self._connection.execute(
+            'SELECT key, value, accessed FROM cache '
+            f'WHERE key IN ({placeholders}) '
+            'AND (expires IS NULL OR expires > ?)',
+            (*keys, now),
+        ).fetchall()
+        stale = [key for key, _, accessed in rows
+                 if now - accessed >= self._access_resolution]
+        if stale:
+            self._connection.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?',
+                ((now, key) for key in stale),
+            )
+        return {key: self._decode(value) for key, value, _ in rows}
+
+    def _cull(self, connection, now):
+        entries, size = connection.execute(
+            'SELECT entries, size FROM cache_stats').fetchone()
+        if entries <= self._max_entries and size <= self._max_size:
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?',
+            (now,),
+        )
+        while True:
+            entries, size = connection.execute(
+                'SELECT entries, size FROM cache_stats').fetchone()
+            if entries <= self._max_entries and size <= self._max_size:
+                return
+            if self._cull_frequency == 0:
+                connection.execute('DELETE FROM cache')
+                return
+            connection.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                (max(entries // self._cull_frequency, 1),),
+            )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with immediate(self._connection) as connection:
+            exists = connection.execute(
+                'SELECT 1 FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, now),
+            ).fetchone()
+            if exists:
+                return False
+            self._write(connection, key, value, timeout, now)
+            self._cull(connection, now)
+        return True
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        return self._fetch([key], time.time()).get(key, default)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with immediate(self._connection) as connection:
+            self._write(connection, key, value, timeout, now)
+            self._cull(connection, now)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        cursor = self._connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, now),
+        )
+        return bool(cursor.rowcount)
+
+    def delete(self, key, version=None):
+        self._connection.execute(
+            'DELETE FROM cache WHERE key = ?', (self._key(key, version),))
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return key in self._fetch([key], time.time())
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with immediate(self._connection) as connection:
+            if INT_MIN <= delta <= INT_MAX:
+                # При переполнении SQLite молча перешел бы на REAL, поэтому
+                # в UPDATE попадают только значения, для которых его нет.
+                cursor = connection.execute(
+                    'UPDATE cache SET value = value + ? WHERE key = ? '
+                    "AND typeof(value) = 'integer' AND value BETWEEN ? AND ? "
+                    'AND (expires IS NULL OR expires > ?)',
+                    (delta, key, INT_MIN - min(delta, 0),
+                     INT_MAX - max(delta, 0), now),
+                )
+                if cursor.rowcount:
+                    return connection.execute(
+                        'SELECT value FROM cache WHERE key = ?',
+                        (key,)).fetchone()[0]
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, now),
+            ).fetchone()
+            value = None if row is None else self._decode(row[0])
+            if type(value) is not int:
+                raise ValueError("Key '%s' not found" % key)
+            value += delta
+            encoded = self._encode(value)
+            connection.execute(
+                'UPDATE cache SET value = ?, size = ? WHERE key = ?',
+                (encoded, self._size(key, encoded), key),
+            )
+            return value
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        found = self._fetch(list(keys), time.time())
+        return {keys[key]: value for key, value in found.items()}
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        with immediate(self._connection) as connection:
+            for key, value in data.items():
+                self._write(
+                    connection, self._key(key, version), value, timeout, now)
+            self._cull(connection, now)
+        return []
+
+    def delete_many(self, keys, version=None):
+        self._connection.executemany(
+            'DELETE FROM cache WHERE key = ?',
+            ((self._key(key, version),) for key in keys),
+        )
+
+    def clear(self):
+        self._connection.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединение живет весь срок жизни потока: открывать его заново
+        # на каждый запрос дороже, чем держать.
+        pass
@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from posts.utils import feed_version
+
+
+def feed_cache(request):
+    """Добавляет версию лент и время жизни их закешированных фрагментов."""
+    return {
+        'feed_version': SimpleLazyObject(feed_version),
+        'feed_cache_timeout': settings.FEED_CACHE_TIMEOUT,
+    }
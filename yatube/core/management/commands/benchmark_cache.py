@@ -0,0 +1,96 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from django.core.management.commands.createcachetable import (
+    Command as CreateCacheTable,
+)
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+from core.cache import SQLiteCache
+
+BENCH_TABLE = 'benchmark_cache_table'
+
+
+def fill(cache, keys):
+    """Запускается в отдельном процессе: пишет ключи в его копию кеша."""
+    connections.close_all()
+    for key in keys:
+        cache.set(key, key)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает SQLiteCache с LocMemCache и DatabaseCache: скорость '
+        'операций и долю попаданий между процессами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--operations', type=int, default=2000,
+            help='Сколько раз повторить каждую операцию.',
+        )
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        create_table = CreateCacheTable()
+        create_table.verbosity = 0
+        create_table.create_table(DEFAULT_DB_ALIAS, BENCH_TABLE, False)
+        # Все записи прогона помещаются в кеш, вытеснение не мешает замерам.
+        params = {'OPTIONS': {'MAX_ENTRIES': options['operations'] * 2}}
+        backends = (
+            ('locmem', LocMemCache('benchmark', params)),
+            ('database', DatabaseCache(BENCH_TABLE, params)),
+            ('sqlite', SQLiteCache(
+                os.path.join(directory, 'cache.sqlite3'), params)),
+        )
+        try:
+            self.stdout.write(
+                f'{"бэкенд":>10} {"set":>9} {"get":>9} {"get_many":>9} '
+                f'{"incr":>9} {"межпроцессных попаданий":>24}'
+            )
+            for name, cache in backends:
+                self.stdout.write(self.run(name, cache, options['operations']))
+        finally:
+            with connection.schema_editor() as editor:
+                editor.execute(
+                    f'DROP TABLE {connection.ops.quote_name(BENCH_TABLE)}')
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def timed(self, operations, action):
+        """Операций в секунду."""
+        start = time.perf_counter()
+        for number in range(operations):
+            action(number)
+        return operations / (time.perf_counter() - start)
+
+    def run(self, name, cache, operations):
+        cache.clear()
+        keys = [f'bench:{number}' for number in range(operations)]
+        cache.set('bench:counter', 0, None)
+        rates = (
+            self.timed(operations, lambda n: cache.set(keys[n], 'x' * 512)),
+            self.timed(operations, lambda n: cache.get(keys[n])),
+            self.timed(
+                operations // 10,
+                lambda n: cache.get_many(keys[n * 10:n * 10 + 10])),
+            self.timed(operations, lambda n: cache.incr('bench:counter')),
+        )
+        cache.clear()
+        shared = [f'shared:{number}' for number in range(100)]
+        connections.close_all()
+        worker = multiprocessing.get_context('fork').Process(
+            target=fill, args=(cache, shared))
+        worker.start()
+        worker.join()
+        hits = len(cache.get_many(shared)) / len(shared)
+        cache.clear()
+        return (
+            f'{name:>10} ' + ' '.join(f'{rate:>9.0f}' for rate in rates)
+            + f' {hits:>24.0%}'
+        )
@@ -0,0 +1,161 @@
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.encoding import escape_uri_path
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .storage import is_hashed
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileRange:
+    """Кусок открытого файла для FileResponse.
+
+    Дескриптор уже перемотан на начало куска, поэтому WSGI-сервер с
+    os.sendfile (например, gunicorn) отдает с текущей позиции ровно
+    Content-Length байт, не копируя их через Python. Без sendfile
+    FileResponse читает через read(), который не выходит за кусок.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """Начало и длина диапазона из заголовка Range.
+
+    None, если диапазон нужно пропустить и отдать файл целиком: заголовка
+    нет, он с ошибкой или просит несколько диапазонов. ValueError, если
+    диапазон целиком за концом файла.
+    """
+    match = RANGE.match(header or '')
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start >= size:
+        raise ValueError('Диапазон за концом файла')
+    return start, end - start + 1
+
+
+def range_allowed(request, etag, last_modified):
+    """Проверка If-Range: диапазон отдается, только если файл не менялся."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def is_immutable(path):
+    """Файлы, чье имя меняется вместе с содержимым.
+
+    Это картинки постов, названные хешем содержимого. Имена миниатюр sorl
+    зависят только от исходника и параметров: при пересоздании другим
+    движком или с --force по тому же адресу окажутся другие байты.
+    """
+    return is_hashed(path)
+
+
+def file_response(request, path, fullpath, size, etag, last_modified):
+    content_type, _ = mimetypes.guess_type(path)
+    content_type = content_type or 'application/octet-stream'
+    header = settings.MEDIA_SENDFILE_HEADER
+    if header == 'X-Accel-Redirect':
+        # Диапазоны и sendfile nginx берет на себя.
+        response = HttpResponse(content_type=content_type)
+        response[header] = escape_uri_path(
+            settings.MEDIA_ACCEL_REDIRECT_PREFIX + path)
+        return response
+    if header == 'X-Sendfile':
+        response = HttpResponse(content_type=content_type)
+        response[header] = fullpath
+        return response
+    try:
+        requested = parse_range(request.META.get('HTTP_RANGE'), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if requested is None or not range_allowed(request, etag, last_modified):
+        return FileResponse(open(fullpath, 'rb'), content_type=content_type)
+    start, length = requested
+    response = FileResponse(
+        FileRange(open(fullpath, 'rb'), start, length),
+        status=206, content_type=content_type,
+    )
+    response['Content-Length'] = length
+    response['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+    return response
+
+
+@require_safe
+def serve(request, path):
+    """Отдает файл из MEDIA_ROOT.
+
+    Сам файл в память не читается: FileResponse отдает его через
+    wsgi.file_wrapper, а с MEDIA_SENDFILE_HEADER отдачу целиком
+    берет на себя веб-сервер. Поддерживаются Range, If-Range и условные
+    запросы по ETag и Last-Modified.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+        stat_result = os.stat(fullpath)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404
+    etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+    last_modified = int(stat_result.st_mtime)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = file_response(
+            request, path, fullpath, stat_result.st_size, etag, last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    if response.status_code == 416:
+        return response
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if is_immutable(path):
+        patch_cache_control(
+            response, public=True,
+            max_age=settings.MEDIA_IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(
+            response, public=True, max_age=settings.MEDIA_MAX_AGE)
+    return response
@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from . import page_cache
+
+
+class AnonymousPageCacheMiddleware:
+    """Отдает анонимам страницы целиком из кеша.
+
+    Кешируются только ответы view, которые пометили страницу метками
+    через page_cache.add_tags. Сигналы сдвигают версии меток, и страница
+    перестает совпадать сразу после изменения данных, от которых зависит.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def is_anonymous(self, request):
+        # Без cookie сессии пользователь заведомо аноним, и поход
+        # в хранилище сессий не нужен.
+        if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+            return True
+        return not request.user.is_authenticated
+
+    def __call__(self, request):
+        if request.method != 'GET' or not self.is_anonymous(request):
+            return self.get_response(request)
+        entry = page_cache.fetch(request)
+        if entry is not None:
+            response = HttpResponse(entry['content'], status=entry['status'])
+            for header, value in entry['headers']:
+                response[header] = value
+            return response
+        started = time.time_ns()
+        response = self.get_response(request)
+        page_cache.store(request, response, started)
+        return response
@@ -0,0 +1,99 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .stampede import cacheable_response
+
+
+def tag_key(tag):
+    return f'page_tag:{tag}'
+
+
+def page_key(request):
+    return f'page:{request.get_host()}:{request.get_full_path()}'
+
+
+def add_tags(request, *tags):
+    """Отмечает, от каких данных зависит страница.
+
+    Страницы без меток в кеш не попадают.
+    """
+    request.page_cache_tags = getattr(request, 'page_cache_tags', set())
+    request.page_cache_tags.update(tags)
+
+
+def _move(tags):
+    now = time.time_ns()
+    cache.set_many({tag_key(tag): now for tag in tags}, None)
+
+
+def invalidate(*tags):
+    """Сдвигает версии меток: все страницы с ними перестают совпадать.
+
+    Версия метки — время сдвига, так store() видит сдвиги, случившиеся,
+    пока view строила страницу. Сигналы приходят до коммита, и страница,
+    прочитанная между ними, несла бы старые данные под новой версией,
+    поэтому после коммита версии сдвигаются еще раз.
+    """
+    _move(tags)
+    transaction.on_commit(lambda: _move(tags))
+
+
+def tag_versions(tags, started):
+    keys = {tag_key(tag): tag for tag in tags}
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Метку еще не сдвигали: годится любая версия не новее запроса.
+            if not cache.add(key, started, None):
+                versions[key] = cache.get(key)
+            else:
+                versions[key] = started
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def version(tag):
+    """Текущая версия метки, например для ETag страниц, зависящих от нее.
+
+    Несдвинутая метка получает нулевую версию, а не время запроса:
+    иначе store() этого же запроса счел бы метку сдвинутой при сборке.
+    """
+    return tag_versions((tag,), 0)[tag]
+
+
+def is_fresh(entry):
+    tags = entry['tags']
+    current = cache.get_many([tag_key(tag) for tag in tags])
+    return all(
+        current.get(tag_key(tag)) == version for tag, version in tags.items())
+
+
+def store(request, response, started):
+    """Кладет страницу в кеш с версиями ее меток.
+
+    started — время начала запроса, до чтения данных во view. Если
+    какую-то метку сдвинули позже, страница могла собраться из старых
+    данных и в кеш не попадает.
+    """
+    tags = getattr(request, 'page_cache_tags', None)
+    if not tags or not cacheable_response(request, response):
+        return
+    versions = tag_versions(tags, started)
+    if any(version is None or version > started
+           for version in versions.values()):
+        return
+    cache.set(page_key(request), {
+        'tags': versions,
+        'status': response.status_code,
+        'headers': list(response.items()),
+        'content': response.content,
+    }, settings.PAGE_CACHE_TIMEOUT)
+
+
+def fetch(request):
+    entry = cache.get(page_key(request))
+    if entry is None or not is_fresh(entry):
+        return None
+    return entry
@@ -0,0 +1,36 @@
+import os
+import shutil
+import tempfile
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+@contextmanager
+def temporary_cache():
+    """Подменяет кеш по умолчанию файлом во временном каталоге."""
+    directory = tempfile.mkdtemp(prefix='yatube-test-cache-')
+    default = dict(
+        settings.CACHES['default'],
+        LOCATION=os.path.join(directory, 'default.sqlite3'),
+    )
+    try:
+        with override_settings(CACHES={**settings.CACHES, 'default': default}):
+            yield
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class TestRunner(DiscoverRunner):
+    """Запускает тесты с временным кешем: они его чистят."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.test_cache = ExitStack()
+        self.test_cache.enter_context(temporary_cache())
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_cache.close()
+        super().teardown_test_environment(**kwargs)
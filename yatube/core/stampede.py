@@ -0,0 +1,107 @@
+import hashlib
+import math
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+
+
+def lock_key(key):
+    return f'{key}:lock'
+
+
+def get_or_compute(key, compute, timeout, cache=default_cache,
+                   cacheable=None):
+    """Отдает значение из кеша, пересчитывая его не больше одним запросом.
+
+    Запись живет в кеше на STAMPEDE_GRACE дольше своего срока, поэтому
+    пока один запрос пересчитывает значение под блокировкой, остальные
+    получают устаревшее. Незадолго до истечения срока значение
+    пересчитывается заранее с вероятностью, растущей к концу срока и
+    пропорциональной длительности пересчета (XFetch). Значение, которое
+    не прошло проверку cacheable, отдается, но в кеш не попадает.
+    """
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None:
+        value, expires, duration = entry
+        early = duration * settings.STAMPEDE_BETA * -math.log(
+            1 - random.random())
+        if now + early < expires:
+            return value
+        if not cache.add(lock_key(key), 1, settings.STAMPEDE_LOCK_TIMEOUT):
+            return value
+    elif not cache.add(lock_key(key), 1, settings.STAMPEDE_LOCK_TIMEOUT):
+        # Холодный кеш и пересчет уже идет: ждем его результат, а если
+        # не дождались, считаем сами.
+        deadline = now + settings.STAMPEDE_WAIT
+        while time.time() < deadline:
+            time.sleep(settings.STAMPEDE_WAIT / 20)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[0]
+        return compute()
+    try:
+        start = time.time()
+        value = compute()
+        duration = time.time() - start
+        expires = math.inf if timeout is None else start + timeout
+        if cacheable is None or cacheable(value):
+            cache.set(
+                key, (value, expires, duration),
+                None if timeout is None else timeout + settings.STAMPEDE_GRACE,
+            )
+    finally:
+        cache.delete(lock_key(key))
+    return value
+
+
+def default_view_key(request, *args, **kwargs):
+    return request.get_full_path(), request.user.pk
+
+
+def cacheable_response(request, response):
+    """Ответ, который можно отдавать из кеша другим запросам.
+
+    Только 200 без cookie. Cookie CSRF ставит middleware уже после view,
+    если страница брала токен, и у ответа из кеша его бы не было.
+    """
+    return (
+        response.status_code == 200 and not response.streaming
+        and not response.cookies and not response.has_header('Set-Cookie')
+        and not request.META.get('CSRF_COOKIE_USED')
+    )
+
+
+def single_flight_cache_page(timeout, key_func=default_view_key,
+                             key_prefix='views'):
+    """Кеширует ответы GET-запросов к view с защитой от лавины пересчетов.
+
+    key_func получает аргументы view и возвращает то, от чего зависит
+    ответ; по умолчанию это полный путь и пользователь. Ответы с другим
+    кодом или cookie отдаются как есть и не кешируются.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            parts = repr(key_func(request, *args, **kwargs)).encode()
+            key = (f'{key_prefix}:{view.__module__}.{view.__name__}:'
+                   f'{hashlib.md5(parts).hexdigest()}')
+
+            def render():
+                response = view(request, *args, **kwargs)
+                if hasattr(response, 'render') and callable(response.render):
+                    response.render()
+                return response
+
+            return get_or_compute(
+                key, render, timeout,
+                cacheable=lambda response: cacheable_response(
+                    request, response),
+            )
+        return wrapper
+    return decorator
@@ -0,0 +1,77 @@
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+from .models import StoredFile
+
+HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.|$)')
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_hashed(name):
+    return bool(HASHED_NAME.search(name))
+
+
+def content_name(name, digest):
+    """Имя файла по хешу содержимого: posts/ab/cd/abcd….jpg.
+
+    Два уровня каталогов по первым байтам хеша дают 65536 каталогов,
+    так что даже миллионы файлов не копятся в одном.
+    """
+    directory = posixpath.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    return posixpath.join(
+        directory, digest[:2], digest[2:4], digest + extension)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла — хеш его содержимого.
+
+    Одинаковые загрузки хранятся одним файлом. Сколько раз файл был
+    сохранен, считается в StoredFile, а delete() удаляет его с диска
+    только вместе с последней ссылкой. Файлы, сохраненные до перехода на
+    это хранилище, в StoredFile не записаны и удаляются сразу.
+    """
+
+    def _save(self, name, content):
+        name = content_name(name, content_hash(content))
+        if not self.exists(name):
+            saved = super()._save(name, content)
+            if saved != name:
+                # Тот же файл параллельно успела сохранить другая загрузка.
+                super().delete(saved)
+        with transaction.atomic():
+            stored, created = StoredFile.objects.get_or_create(name=name)
+            if not created:
+                StoredFile.objects.filter(pk=stored.pk).update(
+                    references=F('references') + 1)
+        return name
+
+    def delete(self, name):
+        if not is_hashed(name):
+            super().delete(name)
+            return
+        with transaction.atomic():
+            shared = StoredFile.objects.filter(
+                name=name, references__gt=1,
+            ).update(references=F('references') - 1)
+            if shared:
+                return
+            StoredFile.objects.filter(name=name).delete()
+            transaction.on_commit(lambda: self._delete_unreferenced(name))
+
+    def _delete_unreferenced(self, name):
+        # Пока транзакция шла, файл могли загрузить заново.
+        if not StoredFile.objects.filter(name=name).exists():
+            super().delete(name)
@@ -0,0 +1,64 @@
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.template import Library, TemplateSyntaxError, VariableDoesNotExist
+from django.templatetags.cache import CacheNode
+
+from core.stampede import get_or_compute
+
+register = Library()
+
+
+class StampedeCacheNode(CacheNode):
+    def render(self, context):
+        try:
+            expire_time = self.expire_time_var.resolve(context)
+        except VariableDoesNotExist:
+            raise TemplateSyntaxError(
+                '"stampede_cache" tag got an unknown variable: %r'
+                % self.expire_time_var.var
+            )
+        if expire_time is not None:
+            expire_time = int(expire_time)
+        try:
+            fragment_cache = caches[
+                self.cache_name.resolve(context) if self.cache_name
+                else 'template_fragments'
+            ]
+        except InvalidCacheBackendError:
+            fragment_cache = caches['default']
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        return get_or_compute(
+            make_template_fragment_key(self.fragment_name, vary_on),
+            lambda: self.nodelist.render(context),
+            expire_time,
+            cache=fragment_cache,
+        )
+
+
+@register.tag('stampede_cache')
+def do_stampede_cache(parser, token):
+    """Как {% cache %}, но фрагмент пересчитывает только один запрос.
+
+    Пока фрагмент пересчитывается, остальные запросы получают прошлую
+    версию, а незадолго до истечения срока он обновляется заранее.
+
+        {% load stampede %}
+        {% stampede_cache 600 index_page page_obj %}
+            ...
+        {% endstampede_cache %}
+    """
+    nodelist = parser.parse(('endstampede_cache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise TemplateSyntaxError(
+            '%r tag requires at least 2 arguments.' % tokens[0])
+    cache_name = None
+    if len(tokens) > 3 and tokens[-1].startswith('using='):
+        cache_name = parser.compile_filter(tokens[-1][len('using='):])
+        tokens = tokens[:-1]
+    return StampedeCacheNode(
+        nodelist, parser.compile_filter(tokens[1]), tokens[2],
+        [parser.compile_filter(token) for token in tokens[3:]],
+        cache_name,
+    )
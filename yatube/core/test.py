@@ -1,6 +1,26 @@
+import os
+import shutil
+import tempfile
+import time
 from http import HTTPStatus
+from unittest import mock
 
-from django.test import TestCase, Client
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.http import HttpResponse
+from django.utils.http import http_date
+from django.template import Context, Template
+from django.db import transaction
+from django.test import (
+    Client, RequestFactory, TestCase, override_settings,
+)
+
+from core.cache import SQLiteCache
+from core.storage import ContentAddressedStorage
+from core.models import StoredFile
+from core.stampede import get_or_compute, lock_key, single_flight_cache_page
 
 
 class StaticPagesURLTests(TestCase):
@@ -12,3 +32,313 @@ class StaticPagesURLTests(TestCase):
         response = self.client.get('/404/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class SQLiteCacheTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.path, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_values_shared_between_instances(self):
+        """Записи одного экземпляра видны другому на том же файле."""
+        self.cache.set('post', {'text': 'Тест'})
+        other = SQLiteCache(self.path, {})
+        self.assertEqual(other.get('post'), {'text': 'Тест'})
+        other.delete('post')
+        self.assertIsNone(self.cache.get('post'))
+
+    def test_add_incr_and_expiry(self):
+        """add не перезаписывает, incr атомарен, просроченное не отдается."""
+        self.assertTrue(self.cache.add('counter', 1))
+        self.assertFalse(self.cache.add('counter', 5))
+        self.assertEqual(self.cache.incr('counter', 2), 3)
+        self.assertEqual(self.cache.decr('counter'), 2)
+        self.cache.set('text', 'строка')
+        with self.assertRaises(ValueError):
+            self.cache.incr('text')
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set('short', 1, timeout=-1)
+        self.assertFalse(self.cache.has_key('short'))
+
+    def test_big_ints(self):
+        """Числа вне INTEGER хранятся как есть, incr не теряет точность."""
+        self.cache.set('big', 2 ** 64)
+        self.assertEqual(self.cache.get('big'), 2 ** 64)
+        self.cache.set('counter', 2 ** 63 - 1)
+        self.assertEqual(self.cache.incr('counter'), 2 ** 63)
+        self.assertEqual(self.cache.get('counter'), 2 ** 63)
+        self.assertEqual(self.cache.decr('counter'), 2 ** 63 - 1)
+        self.assertEqual(self.cache.incr('counter', 2 ** 64), 3 * 2 ** 63 - 1)
+        self.assertEqual(self.cache.incr('counter', -2 ** 64), 2 ** 63 - 1)
+        self.assertEqual(self.cache.incr('counter', 1 - 2 ** 63), 0)
+        self.assertIsInstance(self.cache.get('counter'), int)
+
+    def test_tests_use_own_cache_file(self):
+        """Тесты не пишут в файл кеша работающего сайта."""
+        self.assertFalse(cache._path.startswith(
+            os.path.join(settings.BASE_DIR, 'cache')))
+
+    def test_lru_eviction_by_size(self):
+        """При превышении объема вытесняются давно не читанные записи."""
+        cache = SQLiteCache(self.path, {'OPTIONS': {
+            'MAX_SIZE': 5000, 'ACCESS_RESOLUTION': 0}})
+        cache.set('hot', 'x' * 1000)
+        for number in range(10):
+            cache.get('hot')
+            cache.set(f'cold:{number}', 'x' * 1000)
+        connection = cache._connection
+        entries, size = connection.execute(
+            'SELECT entries, size FROM cache_stats').fetchone()
+        self.assertLessEqual(size, 5000)
+        self.assertEqual(entries, connection.execute(
+            'SELECT COUNT(*) FROM cache').fetchone()[0])
+        self.assertIsNotNone(cache.get('hot'))
+        self.assertIsNone(cache.get('cold:0'))
+
+
+class StampedeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return f'значение {self.calls}'
+
+    def test_value_computed_once(self):
+        """Пока срок не истек, значение берется из кеша."""
+        self.assertEqual(get_or_compute('key', self.compute, 60), 'значение 1')
+        self.assertEqual(get_or_compute('key', self.compute, 60), 'значение 1')
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_value_served_while_locked(self):
+        """Во время чужого пересчета отдается устаревшее значение."""
+        cache.set('key', ('старое', time.time() - 1, 0.1), 60)
+        cache.add(lock_key('key'), 1)
+        self.assertEqual(get_or_compute('key', self.compute, 60), 'старое')
+        self.assertEqual(self.calls, 0)
+        cache.delete(lock_key('key'))
+        self.assertEqual(get_or_compute('key', self.compute, 60), 'значение 1')
+
+    @mock.patch('core.stampede.random.random', return_value=0.99)
+    def test_early_refresh(self, _):
+        """Долгий пересчет запускается до истечения срока."""
+        cache.set('key', ('старое', time.time() + 5, 0.5), 60)
+        self.assertEqual(get_or_compute('key', self.compute, 60), 'старое')
+        cache.set('key', ('старое', time.time() + 5, 2), 60)
+        self.assertEqual(get_or_compute('key', self.compute, 60), 'значение 1')
+
+    def test_template_tag(self):
+        """Тег stampede_cache кеширует фрагмент по vary-аргументам."""
+        template = Template(
+            '{% load stampede %}'
+            '{% stampede_cache 60 fragment name %}{{ value }}'
+            '{% endstampede_cache %}'
+        )
+        self.assertEqual(
+            template.render(Context({'name': 'a', 'value': 1})), '1')
+        self.assertEqual(
+            template.render(Context({'name': 'a', 'value': 2})), '1')
+        self.assertEqual(
+            template.render(Context({'name': 'b', 'value': 2})), '2')
+
+    def test_view_decorator(self):
+        """Декоратор отдает закешированный ответ без вызова view."""
+        @single_flight_cache_page(60)
+        def view(request):
+            self.calls += 1
+            response = HttpResponse(f'ответ {self.calls}')
+            response['X-Test'] = 'yes'
+            return response
+
+        factory = RequestFactory()
+        request = factory.get('/page/')
+        request.user = AnonymousUser()
+        first = view(request)
+        second = view(request)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['X-Test'], 'yes')
+        self.assertEqual(self.calls, 1)
+        request = factory.post('/page/')
+        request.user = AnonymousUser()
+        view(request)
+        self.assertEqual(self.calls, 2)
+
+    def test_view_decorator_caches_only_plain_200(self):
+        """Ошибки и ответы с cookie отдаются, но не кешируются."""
+        @single_flight_cache_page(60)
+        def not_found(request):
+            self.calls += 1
+            return HttpResponse(status=404)
+
+        @single_flight_cache_page(60)
+        def with_cookie(request):
+            self.calls += 1
+            response = HttpResponse()
+            response.set_cookie('name', 'value')
+            return response
+
+        @single_flight_cache_page(60)
+        def with_csrf(request):
+            self.calls += 1
+            request.META['CSRF_COOKIE_USED'] = True
+            return HttpResponse()
+
+        factory = RequestFactory()
+        for view in (not_found, with_cookie, with_csrf):
+            with self.subTest(view=view.__name__):
+                self.calls = 0
+                for _ in range(2):
+                    request = factory.get('/page/')
+                    request.user = AnonymousUser()
+                    view(request)
+                self.assertEqual(self.calls, 2)
+
+
+@mock.patch.object(
+    transaction, 'on_commit', side_effect=lambda callback: callback())
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.storage = ContentAddressedStorage(location=self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_name_by_content_in_shards(self, on_commit):
+        """Имя файла — хеш содержимого в двух уровнях каталогов."""
+        name = self.storage.save('posts/Photo.JPG', ContentFile(b'image'))
+        digest = (
+            '6105d6cc76af400325e94d588ce511be5bfdbb73b437dc51eca43917d7a43e3d')
+        self.assertEqual(name, f'posts/61/05/{digest}.jpg')
+        self.assertTrue(self.storage.exists(name))
+
+    def test_identical_uploads_stored_once(self, on_commit):
+        """Одинаковые загрузки хранятся одним файлом до последней ссылки."""
+        first = self.storage.save('posts/a.gif', ContentFile(b'same'))
+        second = self.storage.save('posts/b.gif', ContentFile(b'same'))
+        other = self.storage.save('posts/c.gif', ContentFile(b'other'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertEqual(
+            StoredFile.objects.get(name=first).references, 2)
+        self.storage.delete(first)
+        self.assertTrue(self.storage.exists(first))
+        self.storage.delete(second)
+        self.assertFalse(self.storage.exists(first))
+        self.assertFalse(StoredFile.objects.filter(name=first).exists())
+
+    def test_legacy_file_deleted_at_once(self, on_commit):
+        """Файлы, сохраненные до хеширования, удаляются сразу."""
+        os.makedirs(os.path.join(self.directory, 'posts'))
+        with open(os.path.join(self.directory, 'posts', 'old.gif'), 'wb') as f:
+            f.write(b'old')
+        self.storage.delete('posts/old.gif')
+        self.assertFalse(self.storage.exists('posts/old.gif'))
+
+
+class MediaServeTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        override = override_settings(MEDIA_ROOT=self.directory)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.storage = ContentAddressedStorage()
+        self.name = self.storage.save(
+            'posts/file.txt', ContentFile(b'0123456789'))
+        self.url = f'/media/{self.name}'
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_file_streamed_with_immutable_cache(self):
+        """Файл с хешем в имени отдается потоком и кешируется навсегда."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_thumbnail_not_immutable(self):
+        """Миниатюры пересоздаются по тому же адресу, immutable им нельзя."""
+        name = 'cache/ab/cd/abcdef.jpg'
+        os.makedirs(os.path.join(self.directory, 'cache', 'ab', 'cd'))
+        with open(os.path.join(self.directory, name), 'wb') as thumbnail:
+            thumbnail.write(b'jpeg')
+        response = self.client.get(f'/media/{name}')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertIn(
+            f'max-age={settings.MEDIA_MAX_AGE}', response['Cache-Control'])
+
+    def test_range(self):
+        """Range отдает кусок файла с кодом 206."""
+        cases = (
+            ('bytes=2-5', 'bytes 2-5/10', b'2345'),
+            ('bytes=7-', 'bytes 7-9/10', b'789'),
+            ('bytes=-3', 'bytes 7-9/10', b'789'),
+            ('bytes=8-100', 'bytes 8-9/10', b'89'),
+        )
+        for header, content_range, content in cases:
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(
+                    response.status_code, HTTPStatus.PARTIAL_CONTENT)
+                self.assertEqual(response['Content-Range'], content_range)
+                self.assertEqual(
+                    response['Content-Length'], str(len(content)))
+                self.assertEqual(
+                    b''.join(response.streaming_content), content)
+
+    def test_unsatisfiable_and_ignored_ranges(self):
+        """Диапазон за концом файла — 416, несколько диапазонов — 200."""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-')
+        self.assertEqual(
+            response.status_code, HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-1,4-5')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_conditional_requests(self):
+        """If-None-Match дает 304, If-Range с чужим ETag — весь файл."""
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        response = self.client.get(
+            self.url, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        response = self.client.get(
+            self.url, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, HTTPStatus.PARTIAL_CONTENT)
+
+    def test_sendfile_headers(self):
+        """С MEDIA_SENDFILE_HEADER файл отдает веб-сервер."""
+        with self.settings(MEDIA_SENDFILE_HEADER='X-Accel-Redirect'):
+            response = self.client.get(self.url)
+        self.assertEqual(
+            response['X-Accel-Redirect'], f'/protected-media/{self.name}')
+        self.assertEqual(response.content, b'')
+        with self.settings(MEDIA_SENDFILE_HEADER='X-Sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(
+            response['X-Sendfile'], os.path.join(self.directory, self.name))
+
+    def test_not_found(self):
+        """Каталоги, несуществующие файлы и выход за MEDIA_ROOT — 404."""
+        for url in ('/media/posts/', '/media/missing.jpg',
+                    '/media/../manage.py'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        response = self.client.post(self.url)
+        self.assertEqual(
+            response.status_code, HTTPStatus.METHOD_NOT_ALLOWED)
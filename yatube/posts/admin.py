@@ -1,28 +1,84 @@
 from django.contrib import admin
 
 from .models import Comment, Follow, Group, Post
+from .search import build_query, matching
+from .utils import EstimatedCountPaginator
 
 
-class PostAdmin(admin.ModelAdmin):
+class LargeTableAdmin(admin.ModelAdmin):
+    """Список, число запросов которого не растет вместе с таблицей."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class RenderedTextAdmin(LargeTableAdmin):
+    def save_model(self, request, obj, form, change):
+        obj.render_text()
+        super().save_model(request, obj, form, change)
+
+
+class PostFilter(admin.SimpleListFilter):
+    """Фильтр по посту без списка всех постов в боковой панели.
+
+    Пост выбирают по ссылке ?post=<id>, в панели виден только он.
+    """
+    title = 'Запись'
+    parameter_name = 'post'
+
+    def lookups(self, request, model_admin):
+        value = self.value()
+        if not value or not value.isdigit():
+            return ()
+        return [(post.pk, post) for post in Post.objects.filter(pk=value)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(post_id=self.value())
+        return queryset
+
+
+class PostAdmin(RenderedTextAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group', 'image',)
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    autocomplete_fields = ('author',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Вместо LIKE '%...%' по всем постам ищем по индексу FTS5.
+        query = build_query(search_term)
+        if not query:
+            return queryset, False
+        return matching(queryset, query), False
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(
+            db_field, request, **kwargs)
+        if db_field.name == 'group':
+            # Строки списка получают копии поля: со списком вместо
+            # queryset группы читаются один раз, а не в каждой строке.
+            formfield.choices = list(formfield.choices)
+        return formfield
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('pk', 'title', 'slug', 'description',)
     prepopulated_fields = {'slug': ('title',)}
 
 
-class CommentAdmin(admin.ModelAdmin):
-    list_display = ('post', 'author', 'text', 'created',)
-    list_filter = ('post',)
+class CommentAdmin(RenderedTextAdmin):
+    list_display = ('post', 'author', 'excerpt', 'created',)
+    list_filter = (PostFilter,)
+    list_select_related = ('post', 'author')
+    autocomplete_fields = ('post', 'author')
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableAdmin):
     list_display = ('user', 'author',)
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
 
 
 admin.site.register(Post, PostAdmin)
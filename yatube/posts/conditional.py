@@ -0,0 +1,65 @@
+import hashlib
+
+from django.db.models import OuterRef, Subquery
+from django.middleware.csrf import get_token
+
+from core import page_cache
+
+from .models import Group, Post, User
+from .utils import feed_version
+
+
+def make_etag(request, *parts):
+    """ETag страницы: данные, от которых она зависит, и ее читатель.
+
+    Версия лент сдвигается при любой правке постов, групп, подписок
+    и пользователей, поэтому ловит и то, чего не видно по датам:
+    удаления и переименования. По той же причине Last-Modified
+    не отдается: даты не меняются при удалении.
+    """
+    raw = ':'.join(map(str, (request.user.pk, feed_version(), *parts)))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def latest(**lookup):
+    """Дата свежего поста ленты, берется из индекса (..., -pub_date, -id)."""
+    return Post.objects.filter(**lookup).order_by('-pub_date').values(
+        'pub_date')[:1]
+
+
+def index_etag(request):
+    return make_etag(request, latest().first())
+
+
+def group_etag(request, slug):
+    group = Group.objects.filter(slug=slug).values_list(
+        'posts_count', Subquery(latest(group=OuterRef('pk')))).first()
+    if group is None:
+        return None
+    return make_etag(request, *group)
+
+
+def profile_etag(request, username):
+    author = User.objects.filter(username=username).values_list(
+        'stats__posts_count', 'stats__followers_count',
+        Subquery(latest(author=OuterRef('pk')))).first()
+    if author is None:
+        return None
+    return make_etag(request, *author)
+
+
+def post_etag(request, post_id):
+    post = Post.objects.filter(pk=post_id).values_list(
+        'updated_at', 'comments_count').first()
+    if post is None:
+        return None
+    # Правка комментария, как и удаление вместе с новым, не меняет
+    # ни пост, ни счетчик, но сдвигает метку комментариев поста.
+    post += (page_cache.version(f'comments:{post_id}'),)
+    if request.user.is_authenticated:
+        # Форма комментария несет CSRF-токен, а вход в аккаунт его меняет.
+        # Сам get_token солит токен заново на каждый вызов, постоянно
+        # лишь значение cookie, которое он кладет в META.
+        get_token(request)
+        post += (request.META['CSRF_COOKIE'],)
+    return make_etag(request, *post)
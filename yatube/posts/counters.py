@@ -0,0 +1,73 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Group, Post, UserStats
+
+User = get_user_model()
+
+
+def bump(queryset, field, delta):
+    """Атомарно сдвигает счетчик в базе, не опускаясь ниже нуля."""
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def bump_user(user_id, field, delta):
+    updated = bump(UserStats.objects.filter(pk=user_id), field, delta)
+    if not updated and delta > 0:
+        # Строки счетчиков нет: создаем ее сразу с настоящими значениями.
+        # При уменьшении так не делаем, пользователь может удаляться.
+        repair_users(User.objects.filter(pk=user_id))
+
+
+def count(model, field):
+    """Подзапрос с настоящим числом строк model, ссылающихся на field."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def repair(queryset, **counters):
+    """Пересчитывает счетчики у строк queryset, возвращает число правок."""
+    fixed = 0
+    names = {f'{field}_actual': expression
+             for field, expression in counters.items()}
+    for row in queryset.annotate(**names).iterator():
+        changed = {
+            field: getattr(row, f'{field}_actual') for field in counters
+            if getattr(row, field) != getattr(row, f'{field}_actual')
+        }
+        if changed:
+            queryset.model.objects.filter(pk=row.pk).update(**changed)
+            fixed += 1
+    return fixed
+
+
+def repair_groups(groups):
+    return repair(groups, posts_count=count(Post, 'group'))
+
+
+def repair_posts(posts):
+    return repair(posts, comments_count=count(Comment, 'post'))
+
+
+def repair_users(users):
+    missing = users.filter(stats__isnull=True).values_list('pk', flat=True)
+    UserStats.objects.bulk_create(
+        UserStats(user_id=pk) for pk in missing)
+    return repair(
+        UserStats.objects.filter(user__in=users),
+        posts_count=count(Post, 'author'),
+        followers_count=count(Follow, 'author'),
+        following_count=count(Follow, 'user'),
+    )
+
+
+REPAIRS = (
+    (Group, repair_groups),
+    (Post, repair_posts),
+    (User, repair_users),
+)
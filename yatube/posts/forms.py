@@ -1,9 +1,19 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
+from .images import normalize
 from .models import Post, Comment
 
 
-class PostForm(forms.ModelForm):
+class RenderedTextForm(forms.ModelForm):
+    """Сохраняет вместе с текстом его готовый HTML и отрывок."""
+
+    def save(self, commit=True):
+        self.instance.render_text()
+        return super().save(commit)
+
+
+class PostForm(RenderedTextForm):
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
@@ -16,8 +26,14 @@ class PostForm(forms.ModelForm):
             'group': 'Выберите Группу'
         }
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if isinstance(image, UploadedFile):
+            return normalize(image)
+        return image
+
 
-class CommentForm(forms.ModelForm):
+class CommentForm(RenderedTextForm):
     class Meta:
         model = Comment
         fields = ('text',)
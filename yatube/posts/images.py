@@ -0,0 +1,80 @@
+import math
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image, ImageOps
+
+# Форматы, которые пересохраняются. GIF не трогаем: анимация
+# при пересохранении потеряется.
+SAVE_OPTIONS = {
+    'JPEG': lambda: {
+        'quality': settings.POST_IMAGE_QUALITY,
+        'optimize': True,
+        'progressive': True,
+    },
+    'WEBP': lambda: {'quality': settings.POST_IMAGE_QUALITY},
+    'PNG': lambda: {'optimize': True},
+}
+METADATA = ('exif', 'icc_profile', 'xmp', 'photoshop', 'comment')
+
+
+def needs_normalizing(image, size):
+    max_width, max_height = settings.POST_IMAGE_MAX_SIZE
+    return (
+        image.width > max_width or image.height > max_height
+        or any(key in image.info for key in METADATA)
+        or size > settings.POST_IMAGE_REENCODE_SIZE
+    )
+
+
+def normalize(upload):
+    """Поворачивает картинку по EXIF, убирает метаданные и ограничивает
+    размер, пересохраняя ее с качеством POST_IMAGE_QUALITY.
+
+    JPEG декодируется сразу в уменьшенном масштабе через draft(), а
+    результат пишется во временный файл, который уходит на диск, если
+    больше FILE_UPLOAD_MAX_MEMORY_SIZE: в памяти не оказывается ни
+    полная картинка, ни полный результат.
+    """
+    upload.seek(0)
+    try:
+        image = Image.open(upload)
+    except Image.DecompressionBombError:
+        raise ValidationError('Слишком большое изображение.')
+    image_format = image.format
+    if (image_format not in SAVE_OPTIONS
+            or not needs_normalizing(image, upload.size)):
+        upload.seek(0)
+        return upload
+    max_size = settings.POST_IMAGE_MAX_SIZE
+    if image_format == 'JPEG':
+        # Поворот по EXIF еще впереди, поэтому берем больший из масштабов
+        # для обеих ориентаций.
+        width, height = image.size
+        factor = max(
+            min(max_size[0] / width, max_size[1] / height),
+            min(max_size[0] / height, max_size[1] / width),
+        )
+        if factor < 1:
+            image.draft(image.mode, (
+                math.ceil(width * factor), math.ceil(height * factor)))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(max_size, Image.LANCZOS)
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    # Часть кодеков берет EXIF и ICC из image.info, если их не передать.
+    image.info = {
+        key: value for key, value in image.info.items()
+        if key == 'transparency'
+    }
+    output = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    image.save(output, image_format, **SAVE_OPTIONS[image_format]())
+    size = output.tell()
+    output.seek(0)
+    return UploadedFile(
+        output, name=upload.name, content_type=upload.content_type,
+        size=size,
+    )
@@ -0,0 +1,103 @@
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from PIL import Image
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.engines.pil_engine import Engine
+from sorl.thumbnail.parsers import parse_geometry
+
+from posts import thumbnails
+from posts.thumbnails import DraftEngine
+
+ENGINES = (
+    ('pil', Engine),
+    ('draft', DraftEngine),
+)
+
+
+def make_fixture(path, width, height, seed):
+    """Большая JPEG-картинка с деталями, похожая на фото с телефона."""
+    image = Image.effect_mandelbrot(
+        (width, height), (-2 + seed / 10, -1.2, 1, 1.2), 100)
+    noise = Image.effect_noise((width, height), 32)
+    Image.merge('RGB', (image, noise, image)).save(path, 'JPEG', quality=90)
+
+
+def run_engine(engine_class, paths, geometry, options, queue):
+    """Выполняется в отдельном процессе, чтобы пик памяти был только его."""
+    engine = engine_class()
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    for path in paths:
+        with open(path, 'rb') as source:
+            image = Image.open(source)
+            ratio = engine.get_image_ratio(image, options)
+            engine.create(image, parse_geometry(geometry, ratio), options)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    queue.put((elapsed, peak))
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает DraftEngine со штатным PIL-движком sorl-thumbnail '
+        'на больших JPEG: время и прирост пиковой памяти на процесс.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--images', type=int, default=5,
+            help='Сколько картинок сгенерировать для замера.',
+        )
+        parser.add_argument(
+            '--size', default='6000x4000',
+            help='Размер картинок, ШИРИНАxВЫСОТА.',
+        )
+
+    def handle(self, *args, **options):
+        width, height = map(int, options['size'].split('x'))
+        directory = tempfile.mkdtemp()
+        try:
+            paths = []
+            for number in range(options['images']):
+                path = os.path.join(directory, f'{number}.jpg')
+                make_fixture(path, width, height, number)
+                paths.append(path)
+            self.stdout.write(
+                f'{options["images"]} картинок {width}x{height}')
+            self.stdout.write(
+                f'{"движок":>8} {"геометрия":>10} {"мс на картинку":>15} '
+                f'{"пик памяти, МБ":>15}'
+            )
+            for geometry, extra in thumbnails.variants().values():
+                if extra.get('format') != 'JPEG':
+                    continue
+                engine_options = dict(
+                    ThumbnailBackend.default_options, **extra)
+                for name, engine_class in ENGINES:
+                    elapsed, peak = self.measure(
+                        engine_class, paths, geometry, engine_options)
+                    self.stdout.write(
+                        f'{name:>8} {geometry:>10} '
+                        f'{elapsed / len(paths) * 1000:>15.1f} '
+                        f'{peak / 1024:>15.1f}'
+                    )
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def measure(self, engine_class, paths, geometry, options):
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        worker = context.Process(
+            target=run_engine,
+            args=(engine_class, paths, geometry, options, queue),
+        )
+        worker.start()
+        result = queue.get()
+        worker.join()
+        return result
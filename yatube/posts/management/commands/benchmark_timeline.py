@@ -0,0 +1,115 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from posts import timeline
+from posts.models import Follow, Post, Timeline
+from posts.utils import CURSOR_NEXT, CursorPaginator, encode_cursor
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет стоимость записи и чтения ленты подписок по обе стороны '
+        'порога TIMELINE_FANOUT_LIMIT. Все данные откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        limit = settings.TIMELINE_FANOUT_LIMIT
+        parser.add_argument(
+            '--followers', type=int, nargs='+',
+            default=[limit // 10, limit - 1, limit, limit * 5],
+            help='Число подписчиков автора в каждом прогоне.',
+        )
+        parser.add_argument(
+            '--posts', type=int, default=20,
+            help='Сколько постов публикует автор в каждом прогоне.',
+        )
+        parser.add_argument(
+            '--history', type=int, default=1000,
+            help='Сколько старых постов уже лежит в ленте читателя.',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'Порог раскладки: {settings.TIMELINE_FANOUT_LIMIT} подписчиков')
+        self.stdout.write(
+            f'{"подписчики":>10} {"режим":>6} {"запись, мс":>11} '
+            f'{"запросов":>9} {"строк":>7} {"чтение, мс":>11} '
+            f'{"запросов":>9} {"глубже, мс":>11}'
+        )
+        for followers in options['followers']:
+            with transaction.atomic():
+                self.stdout.write(self.run(
+                    followers, options['posts'], options['history']))
+                transaction.set_rollback(True)
+            cache.delete(timeline.CELEBRITIES_KEY)
+
+    def run(self, followers, posts, history):
+        author = User.objects.create_user(username=f'bench-{followers}')
+        User.objects.bulk_create(
+            User(username=f'bench-{followers}-{i}') for i in range(followers))
+        readers = User.objects.filter(
+            username__startswith=f'bench-{followers}-')
+        Follow.objects.bulk_create(
+            Follow(user=reader, author=author) for reader in readers)
+        is_celebrity = timeline.followers_changed(author)
+        reader = readers.first()
+        self.fill_history(reader, f'bench-{followers}-old', history)
+
+        with CaptureQueriesContext(connection) as write_queries:
+            start = time.perf_counter()
+            for number in range(posts):
+                Post.objects.create(author=author, text=f'Пост {number}')
+            write_time = (time.perf_counter() - start) / posts
+        rows = Timeline.objects.filter(post__author=author).count()
+
+        paginator = CursorPaginator(
+            timeline.follow_feed(reader), settings.PAGINATOR_POST_LIMIT,
+            keys=('feed_date', 'feed_id'))
+        with CaptureQueriesContext(connection) as read_queries:
+            start = time.perf_counter()
+            page = paginator.get_page(None)
+            read_time = time.perf_counter() - start
+        assert len(page) == min(
+            posts + history, settings.PAGINATOR_POST_LIMIT)
+        # Страница из середины старой ленты: здесь видно, читается ли
+        # лента диапазоном по индексу или целиком.
+        deep_time = 0
+        if history:
+            middle = Timeline.objects.filter(user=reader).order_by(
+                '-pub_date', '-post')[history // 2].post
+            start = time.perf_counter()
+            paginator.get_page(encode_cursor(CURSOR_NEXT, middle))
+            deep_time = time.perf_counter() - start
+
+        return (
+            f'{followers:>10} {"pull" if is_celebrity else "push":>6} '
+            f'{write_time * 1000:>11.2f} '
+            f'{len(write_queries) / posts:>9.1f} {rows // posts:>7} '
+            f'{read_time * 1000:>11.2f} {len(read_queries):>9} '
+            f'{deep_time * 1000:>11.2f}'
+        )
+
+    def fill_history(self, reader, username, history):
+        """Старые посты обычного автора, уже разложенные в ленту читателя."""
+        author = User.objects.create_user(username=username)
+        Follow.objects.create(user=reader, author=author)
+        Post.objects.bulk_create(
+            Post(author=author, text=f'Старый пост {number}')
+            for number in range(history))
+        # pub_date ставит auto_now_add, старыми посты делает update.
+        Post.objects.filter(author=author).update(
+            pub_date=timezone.now() - timedelta(days=1))
+        Timeline.objects.bulk_create(
+            Timeline(user=reader, post_id=pk, pub_date=pub_date)
+            for pk, pub_date in Post.objects.filter(
+                author=author).values_list('pk', 'pub_date'))
@@ -0,0 +1,130 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connections
+from sorl.thumbnail import default
+
+from posts import thumbnails
+from posts.models import Post
+
+CHECKPOINT_KEY = 'thumbnails:generate:last_pk'
+
+
+def render(name, force=False):
+    """Выполняется в процессе пула: создает все миниатюры картинки."""
+    try:
+        thumbnails.generate(thumbnails.source(name), force=force)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает миниатюры и адаптивные варианты для уже загруженных картинок '
+        'постов в нескольких процессах. Готовые миниатюры пропускаются, '
+        'прерванный запуск продолжается с места остановки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Число процессов, по умолчанию по числу ядер.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help='Сколько постов читать из базы за один запрос.',
+        )
+        parser.add_argument(
+            '--max-rate', type=float, default=0,
+            help='Не больше стольких картинок в секунду, 0 — без ограничения.',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать с первого поста, а не с сохраненной позиции.',
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать и уже готовые миниатюры.',
+        )
+
+    def handle(self, *args, **options):
+        last_pk = 0 if options['restart'] else cache.get(CHECKPOINT_KEY, 0)
+        posts = Post.objects.exclude(image='').order_by('pk')
+        total = posts.filter(pk__gt=last_pk).count()
+        if last_pk:
+            self.stdout.write(f'Продолжаем после поста {last_pk}')
+        self.rendered = self.skipped = self.failed = 0
+        workers = options['workers'] or os.cpu_count()
+        self.started = time.perf_counter()
+        interval = 1 / options['max_rate'] if options['max_rate'] else 0
+        # Соединения родителя не должны достаться процессам пула.
+        connections.close_all()
+        with ProcessPoolExecutor(workers) as pool:
+            # Очередь ограничена, чтобы не держать в памяти весь бэклог.
+            limit = workers * 2
+            pending = set()
+            while True:
+                batch = list(posts.filter(pk__gt=last_pk).values_list(
+                    'pk', 'image')[:options['batch_size']])
+                if not batch:
+                    break
+                todo = batch if options['force'] else self.missing(batch)
+                self.skipped += len(batch) - len(todo)
+                self.done = []
+                for pk, name in todo:
+                    if len(pending) >= limit:
+                        pending = self.collect(pending, FIRST_COMPLETED)
+                    future = pool.submit(render, name, options['force'])
+                    future.pk, future.name = pk, name
+                    pending.add(future)
+                    if interval:
+                        time.sleep(interval)
+                pending = self.collect(pending)
+                # Карточки, собранные с исходной картинкой, устарели.
+                thumbnails.refresh(*self.done)
+                last_pk = batch[-1][0]
+                cache.set(CHECKPOINT_KEY, last_pk, None)
+                self.report(total)
+        cache.delete(CHECKPOINT_KEY)
+        self.stdout.write(self.style.SUCCESS('Готово'))
+
+    def missing(self, batch):
+        """Посты пачки, у которых готовы не все миниатюры."""
+        wanted = {
+            post: [
+                default.backend.thumbnail_file(
+                    thumbnails.source(post[1]), geometry, **options)[1]
+                for geometry, options in thumbnails.variants().values()
+            ]
+            for post in batch
+        }
+        found = thumbnails.get_many([
+            thumbnail for files in wanted.values() for thumbnail in files])
+        return [
+            post for post, files in wanted.items()
+            if not all(thumbnail.key in found for thumbnail in files)
+        ]
+
+    def collect(self, pending, return_when='ALL_COMPLETED'):
+        done, pending = wait(pending, return_when=return_when)
+        for future in done:
+            error = future.exception()
+            if error is None:
+                self.rendered += 1
+                self.done.append(future.pk)
+            else:
+                self.failed += 1
+                self.stderr.write(f'{future.name}: {error}')
+        return pending
+
+    def report(self, total):
+        elapsed = time.perf_counter() - self.started
+        processed = self.rendered + self.skipped + self.failed
+        self.stdout.write(
+            f'{processed}/{total}: создано {self.rendered}, '
+            f'пропущено {self.skipped}, ошибок {self.failed}, '
+            f'{self.rendered / elapsed:.1f} картинок/с'
+        )
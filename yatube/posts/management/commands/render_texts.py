@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет готовый HTML и отрывок текста у записей и комментариев, '
+        'сохраненных до появления этих полей. Работает пачками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк обрабатывать за один запрос.',
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перерисовать все строки, а не только незаполненные.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model in (Post, Comment):
+            rows = model.objects.order_by('pk').only('pk', 'text')
+            if not options['all']:
+                rows = rows.filter(text_html='')
+            rendered = 0
+            last_pk = None
+            while True:
+                batch = rows if last_pk is None else rows.filter(
+                    pk__gt=last_pk)
+                batch = list(batch[:batch_size])
+                if not batch:
+                    break
+                for obj in batch:
+                    obj.render_text()
+                model.objects.bulk_update(batch, ('text_html', 'excerpt'))
+                rendered += len(batch)
+                last_pk = batch[-1].pk
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: обработано {rendered}')
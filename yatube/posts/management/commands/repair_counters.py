@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import REPAIRS
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает денормализованные счетчики записей, комментариев '
+        'и подписок пачками и исправляет расхождения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк пересчитывать за один запрос.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model, repair in REPAIRS:
+            checked = fixed = 0
+            last_pk = None
+            while True:
+                batch = model.objects.order_by('pk')
+                if last_pk is not None:
+                    batch = batch.filter(pk__gt=last_pk)
+                pks = list(batch.values_list('pk', flat=True)[:batch_size])
+                if not pks:
+                    break
+                fixed += repair(model.objects.filter(pk__in=pks))
+                checked += len(pks)
+                last_pk = pks[-1]
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: проверено {checked}, '
+                f'исправлено {fixed}'
+            )
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core import page_cache
+from core.storage import is_hashed
+from posts.models import Post
+from posts.utils import bump_feed_version
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов, загруженные до хранилища по '
+        'содержимому, в каталоги по хешу. Одинаковые картинки сливаются '
+        'в один файл, старые файлы удаляются. Работает пачками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help='Сколько постов переносить за одну транзакцию.',
+        )
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        posts = Post.objects.exclude(image='').order_by('pk')
+        moved = missing = 0
+        last_pk = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk).values_list(
+                'pk', 'image')[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            old_names = set()
+            moved_pks = []
+            with transaction.atomic():
+                for pk, name in batch:
+                    if is_hashed(name):
+                        continue
+                    if not storage.exists(name):
+                        missing += 1
+                        self.stderr.write(f'Пост {pk}: нет файла {name}')
+                        continue
+                    with storage.open(name) as source:
+                        new_name = storage.save(name, source)
+                    # updated_at сбрасывает кеш карточки со старым адресом.
+                    Post.objects.filter(pk=pk).update(
+                        image=new_name, updated_at=timezone.now())
+                    old_names.add(name)
+                    moved_pks.append(pk)
+            moved += len(moved_pks)
+            page_cache.invalidate(*(f'post:{pk}' for pk in moved_pks))
+            for name in old_names:
+                if not Post.objects.filter(image=name).exists():
+                    storage.delete(name)
+            self.stdout.write(f'Перенесено {moved}, без файла {missing}')
+        if moved:
+            bump_feed_version()
+        self.stdout.write(self.style.SUCCESS(
+            'Готово. Миниатюры для новых имен создаст generate_thumbnails, '
+            'старые уберет thumbnail cleanup.'
+        ))
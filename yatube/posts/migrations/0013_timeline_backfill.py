@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def backfill_timeline(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    Timeline = apps.get_model('posts', 'Timeline')
+    for follow in Follow.objects.iterator():
+        posts = Post.objects.filter(
+            author_id=follow.author_id).values_list('pk', 'pub_date')
+        Timeline.objects.bulk_create(
+            (Timeline(user_id=follow.user_id, post_id=pk, pub_date=pub_date)
+             for pk, pub_date in posts.iterator()),
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_timeline'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_timeline, migrations.RunPython.noop),
+    ]
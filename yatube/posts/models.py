@@ -1,6 +1,10 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils.html import linebreaks
+from django.utils.text import Truncator
+
+from core.storage import ContentAddressedStorage
 
 
 User = get_user_model()
@@ -10,6 +14,8 @@ class Group(models.Model):
     title = models.CharField('Сообщество', max_length=200)
     slug = models.SlugField('Страница Сообщество', unique=True)
     description = models.TextField('Описание')
+    posts_count = models.PositiveIntegerField(
+        'Число записей', default=0, editable=False)
 
     class Meta:
         verbose_name = 'Дневник'
@@ -19,7 +25,29 @@ class Group(models.Model):
         return self.title
 
 
-class Post(models.Model):
+class RenderedText(models.Model):
+    """Текст, заранее переведенный в HTML, чтобы не делать этого в шаблонах.
+
+    Поля заполняет render_text(): его вызывают формы при сохранении,
+    а для старых строк — команда render_texts.
+    """
+    text_html = models.TextField('Текст в HTML', blank=True, editable=False)
+    excerpt = models.CharField(
+        'Отрывок', max_length=settings.LIMIT_TEXT, blank=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        # Строки, еще не прошедшие render_text(), обрезаются на лету.
+        return self.excerpt or Truncator(self.text).chars(settings.LIMIT_TEXT)
+
+    def render_text(self):
+        self.text_html = linebreaks(self.text, autoescape=True)
+        self.excerpt = Truncator(self.text).chars(settings.LIMIT_TEXT)
+
+
+class Post(RenderedText):
     text = models.TextField('Запись', help_text='Введите текст поста')
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
     author = models.ForeignKey(
@@ -40,19 +68,31 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев', default=0, editable=False)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
 
     class Meta:
         verbose_name = 'Запись'
         verbose_name_plural = 'Записи'
         ordering = ('-pub_date',)
-
-    def __str__(self):
-        return self.text[:settings.LIMIT_TEXT_MODEL]
-
-
-class Comment(models.Model):
+        indexes = (
+            models.Index(fields=('-pub_date', '-id'), name='post_date_idx'),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='post_author_date_idx'
+            ),
+            models.Index(
+                fields=('group', '-pub_date', '-id'),
+                name='post_group_date_idx'
+            ),
+        )
+
+
+class Comment(RenderedText):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -73,6 +113,12 @@ class Comment(models.Model):
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
         ordering = ('-created',)
+        indexes = (
+            models.Index(
+                fields=('post', '-created', '-id'),
+                name='comment_post_created_idx'
+            ),
+        )
 
 
 class Follow(models.Model):
@@ -92,3 +138,58 @@ class Follow(models.Model):
     class Meta:
         verbose_name = 'Подписка на автора'
         verbose_name_plural = 'Подписки на авторов'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'author'), name='follow_unique_user_author'),
+        )
+
+
+class UserStats(models.Model):
+    """Денормализованные счетчики пользователя."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField('Число записей', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Число подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Счетчики пользователя'
+        verbose_name_plural = 'Счетчики пользователей'
+
+
+class Timeline(models.Model):
+    """Материализованная лента подписок: пост, разложенный подписчику."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Запись'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Ленты подписок'
+        ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-post'),
+                name='timeline_user_date_idx'
+            ),
+        )
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'post'), name='timeline_unique_user_post'),
+        )
@@ -0,0 +1,101 @@
+"""Полнотекстовый поиск по постам на SQLite FTS5.
+
+Индекс posts_post_fts хранит только токены, сам текст берется из
+posts_post (external content). В синхронизации его держат триггеры на
+вставку, правку и удаление постов, так что обновлять индекс из Python
+не нужно. Индекс и триггеры создает миграция 0019_post_search. SQLite
+пересоздает таблицу при многих ALTER TABLE, и триггеры при этом
+пропадают: миграции, меняющие posts_post, должны создавать их заново.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.utils.html import escape
+
+from .models import Post
+
+WORD = re.compile(r'\w+')
+# Управляющие символы не встречаются в тексте постов, ими snippet()
+# отмечает совпадения, чтобы текст можно было экранировать целиком.
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+
+def build_query(text):
+    """Запрос FTS5 из пользовательского ввода.
+
+    Каждое слово берется в кавычки, поэтому операторы FTS5 в вводе не
+    работают и не ломают запрос. Слова ищутся по префиксу — это
+    покрывает окончания — и все должны встретиться в посте.
+    """
+    return ' '.join(f'"{word}"*' for word in WORD.findall(text))
+
+
+def matching(queryset, query):
+    """Посты queryset, подходящие под запрос build_query().
+
+    RawSQL в pk__in SQLite получил бы в двойных скобках, то есть как
+    скалярный подзапрос с одной строкой, поэтому условие идет через extra.
+    """
+    return queryset.extra(
+        where=['posts_post.id IN (SELECT rowid FROM posts_post_fts '
+               'WHERE posts_post_fts MATCH %s)'],
+        params=(query,),
+    )
+
+
+def highlight(snippet):
+    return escape(snippet).replace(
+        MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+
+class SearchResults:
+    """Найденные посты по убыванию релевантности (bm25).
+
+    Ведет себя как последовательность для Paginator: count() и срезы
+    выполняются одним запросом к индексу каждый, а посты страницы
+    загружаются отдельным запросом по id. У каждого поста есть snippet —
+    фрагмент текста с подсвеченными совпадениями.
+    """
+
+    def __init__(self, text):
+        self.query = build_query(text)
+
+    def count(self):
+        if not self.query:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT COUNT(*) FROM posts_post_fts '
+                'WHERE posts_post_fts MATCH %s', (self.query,))
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step:
+            raise TypeError('SearchResults поддерживает только срезы.')
+        if not self.query:
+            return []
+        start = key.start or 0
+        limit = -1 if key.stop is None else max(key.stop - start, 0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT rowid, snippet(posts_post_fts, 0, %s, %s, %s, %s) '
+                'FROM posts_post_fts WHERE posts_post_fts MATCH %s '
+                'ORDER BY rank, rowid DESC LIMIT %s OFFSET %s',
+                (MATCH_START, MATCH_END, '…', settings.SEARCH_SNIPPET_WORDS,
+                 self.query, limit, start),
+            )
+            rows = cursor.fetchall()
+        posts = Post.objects.select_related('author', 'group').in_bulk(
+            [pk for pk, _ in rows])
+        result = []
+        for pk, snippet in rows:
+            # Пост мог быть удален между запросами.
+            if pk in posts:
+                posts[pk].snippet = highlight(snippet)
+                result.append(posts[pk])
+        return result
@@ -0,0 +1,205 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core import page_cache
+from core.storage import is_hashed
+
+from . import timeline
+from .counters import bump, bump_user
+from .models import Comment, Follow, Group, Post, UserStats
+from .utils import bump_feed_version, feed_key, invalidate_feed_counts
+
+User = get_user_model()
+
+
+def post_feeds(post, *group_ids):
+    """Ленты, в которые попадает пост."""
+    feeds = [feed_key('index'), feed_key('author', post.author_id)]
+    feeds += [feed_key('group', pk) for pk in set(group_ids) if pk]
+    if post.author_id in timeline.celebrities():
+        # Счетчики лент подписчиков популярного автора доживают таймаут,
+        # иначе каждый его пост стоил бы удаления ключа на подписчика.
+        return feeds
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    feeds += [feed_key('follow', pk) for pk in followers]
+    return feeds
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_group(sender, instance, **kwargs):
+    instance._previous_group_id = instance._previous_image = None
+    # Файл новой загрузки еще не сохранен: это делает save() после сигнала.
+    instance._image_uploaded = not instance.image._committed
+    if instance.pk:
+        instance._previous_group_id, instance._previous_image = (
+            Post.objects.filter(pk=instance.pk).values_list(
+                'group_id', 'image').first() or (None, None))
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, **kwargs):
+    invalidate_feed_counts(*post_feeds(
+        instance, instance.group_id,
+        getattr(instance, '_previous_group_id', None)))
+
+
+@receiver(post_save, sender=Post)
+def post_fan_out(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        timeline.invalidate_recent_posts(instance.author_id)
+        timeline.fan_out(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    invalidate_feed_counts(*post_feeds(instance, instance.group_id))
+    timeline.invalidate_recent_posts(instance.author_id)
+
+
+def release_image(name):
+    """Отпускает ссылку поста на файл картинки.
+
+    Картинки, загруженные до хранилища по содержимому, не трогаем:
+    их переносит и удаляет команда shard_images.
+    """
+    if name and is_hashed(name):
+        Post._meta.get_field('image').storage.delete(name)
+
+
+@receiver(post_save, sender=Post)
+def post_image_replaced(sender, instance, raw, **kwargs):
+    previous = getattr(instance, '_previous_image', None)
+    if raw or not previous:
+        return
+    # Новая загрузка, даже той же картинки, добавила ссылку на файл.
+    if (previous != instance.image.name
+            or getattr(instance, '_image_uploaded', False)):
+        release_image(previous)
+
+
+@receiver(post_delete, sender=Post)
+def post_image_deleted(sender, instance, **kwargs):
+    release_image(instance.image.name)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_changed(sender, instance, **kwargs):
+    invalidate_feed_counts(feed_key('follow', instance.user_id))
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        if not timeline.followers_changed(instance.author):
+            timeline.backfill(instance.user, instance.author)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    timeline.prune(instance.user, instance.author)
+    timeline.followers_changed(instance.author)
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def post_counters_saved(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    if created:
+        bump_user(instance.author_id, 'posts_count', 1)
+    elif previous_group_id == instance.group_id:
+        return
+    elif previous_group_id:
+        bump(Group.objects.filter(pk=previous_group_id), 'posts_count', -1)
+    if instance.group_id:
+        bump(Group.objects.filter(pk=instance.group_id), 'posts_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def post_counters_deleted(sender, instance, **kwargs):
+    bump_user(instance.author_id, 'posts_count', -1)
+    if instance.group_id:
+        bump(Group.objects.filter(pk=instance.group_id), 'posts_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_counters_saved(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        bump(Post.objects.filter(pk=instance.post_id), 'comments_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_counters_deleted(sender, instance, **kwargs):
+    bump(Post.objects.filter(pk=instance.post_id), 'comments_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_counters_saved(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        bump_user(instance.author_id, 'followers_count', 1)
+        bump_user(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_counters_deleted(sender, instance, **kwargs):
+    bump_user(instance.author_id, 'followers_count', -1)
+    bump_user(instance.user_id, 'following_count', -1)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+@receiver(post_delete, sender=User)
+def feed_changed(sender, **kwargs):
+    bump_feed_version()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, update_fields=None, **kwargs):
+    # Вход пользователя сохраняет только last_login, ленты он не меняет.
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        bump_feed_version()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_pages_changed(sender, instance, **kwargs):
+    groups = {instance.group_id, getattr(instance, '_previous_group_id', None)}
+    page_cache.invalidate(
+        f'post:{instance.pk}',
+        f"feed:{feed_key('index')}",
+        f"feed:{feed_key('author', instance.author_id)}",
+        *(f"feed:{feed_key('group', pk)}" for pk in groups if pk),
+    )
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_pages_changed(sender, instance, **kwargs):
+    page_cache.invalidate(
+        f'group:{instance.pk}', f"feed:{feed_key('group', instance.pk)}")
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_pages_changed(sender, instance, **kwargs):
+    page_cache.invalidate(f'comments:{instance.post_id}')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_pages_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        page_cache.invalidate(f'user:{instance.pk}')
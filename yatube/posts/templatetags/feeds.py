@@ -0,0 +1,10 @@
+from django import template
+
+from posts import utils
+
+register = template.Library()
+
+
+@register.filter
+def next_cursor(page_obj):
+    return utils.next_cursor(page_obj) or ''
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.template import Library
+from django.utils.html import format_html, format_html_join
+from sorl.thumbnail.templatetags.thumbnail import safe_filter
+
+from posts import thumbnails
+
+register = Library()
+
+
+@register.simple_tag
+def prefetch_thumbnails(posts):
+    """Загружает миниатюры всех постов страницы до цикла по ним.
+
+        {% prefetch_thumbnails page_obj %}
+    """
+    thumbnails.prefetch(posts)
+    return ''
+
+
+def srcset(thumbnails):
+    return format_html_join(
+        ', ', '{} {}w', ((im.url, im.width) for im in thumbnails))
+
+
+@register.simple_tag
+@safe_filter(error_output='')
+def post_picture(file_, css_class=''):
+    """Картинка поста с вариантами WebP и JPEG нескольких ширин.
+
+        {% post_picture post.image "card-img my-2" %}
+
+    Браузер сам выбирает формат и ширину по sizes из POST_IMAGE_SIZES.
+    Пока вариантов JPEG нет, выводится сама картинка, а формат без
+    готовых вариантов пропускается.
+    """
+    if not file_:
+        return ''
+    names = {
+        image_format: [
+            name for name, (_, options) in thumbnails.variants().items()
+            if options.get('format') == image_format
+        ]
+        for image_format in thumbnails.image_formats()
+    }
+    found = thumbnails.get_variants(
+        file_, [name for group in names.values() for name in group])
+    by_format = {
+        image_format: sorted(
+            (found[name] for name in group), key=lambda im: im.width)
+        for image_format, group in names.items()
+        if all(found[name] for name in group)
+    }
+    fallback = by_format.pop('JPEG', None)
+    if not fallback:
+        return format_html(
+            '<img class="{}" src="{}" loading="lazy" alt="">',
+            css_class, file_.url,
+        )
+    sources = format_html_join(
+        '', '<source type="image/{}" srcset="{}" sizes="{}">',
+        ((image_format.lower(), srcset(images), settings.POST_IMAGE_SIZES)
+         for image_format, images in by_format.items()),
+    )
+    largest = fallback[-1]
+    return format_html(
+        '<picture>{}<img class="{}" src="{}" srcset="{}" sizes="{}" '
+        'width="{}" height="{}" loading="lazy" alt=""></picture>',
+        sources, css_class, largest.url, srcset(fallback),
+        settings.POST_IMAGE_SIZES, largest.width, largest.height,
+    )
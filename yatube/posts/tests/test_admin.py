@@ -0,0 +1,82 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class AdminChangelistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def add_rows(self, number):
+        for _ in range(number):
+            user = User.objects.create_user(
+                username=f'user{User.objects.count()}')
+            Group.objects.create(
+                title='Группа', slug=f'group{Group.objects.count()}',
+                description='Описание')
+            post = Post.objects.create(
+                author=user, group=self.group, text='Пост')
+            Comment.objects.create(post=post, author=user, text='Комментарий')
+            Follow.objects.create(user=user, author=self.admin)
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists_constant_queries(self):
+        """Число запросов списков не зависит от числа строк."""
+        urls = (
+            reverse('admin:posts_post_changelist'),
+            reverse('admin:posts_comment_changelist'),
+            reverse('admin:posts_follow_changelist'),
+        )
+        self.add_rows(2)
+        few = [self.count_queries(url) for url in urls]
+        self.add_rows(5)
+        many = [self.count_queries(url) for url in urls]
+        self.assertEqual(few, many)
+
+    def test_post_filter_lists_only_selected_post(self):
+        """Фильтр комментариев по посту не выводит все посты."""
+        self.add_rows(3)
+        post = Post.objects.first()
+        url = reverse('admin:posts_comment_changelist')
+        response = self.client.get(url)
+        self.assertNotContains(response, f'?post={post.pk}')
+        response = self.client.get(url, {'post': post.pk})
+        self.assertEqual(
+            [comment.post for comment in response.context['cl'].result_list],
+            [post])
+        self.assertContains(response, f'?post={post.pk}')
+
+    @override_settings(ADMIN_COUNT_LIMIT=2)
+    def test_estimated_count(self):
+        """Число строк без фильтров кешируется, с фильтрами ограничено."""
+        self.add_rows(3)
+        url = reverse('admin:posts_post_changelist')
+        response = self.client.get(url)
+        self.assertEqual(response.context['cl'].result_count, 3)
+        Post.objects.filter(pk=Post.objects.first().pk).delete()
+        response = self.client.get(url)
+        self.assertEqual(response.context['cl'].result_count, 3)
+        response = self.client.get(url, {'q': 'Пост'})
+        self.assertEqual(response.context['cl'].result_count, 2)
@@ -0,0 +1,105 @@
+from http import HTTPStatus
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Group, Post
+
+User = get_user_model()
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Luser')
+        cls.reader = User.objects.create_user(username='Lower')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slug',
+            description='Жили-были',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.group)
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+
+    def revalidate(self, client, url, response):
+        return client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_pages_not_modified(self):
+        """Неизменная страница отвечает 304 без ленты и рендера."""
+        for client in (Client(), self.authorized_client):
+            for url in self.urls:
+                with self.subTest(url=url):
+                    response = client.get(url)
+                    with self.assertNumQueries(
+                            0 if client is not self.authorized_client
+                            else 3):
+                        response = self.revalidate(client, url, response)
+                    self.assertEqual(
+                        response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_changes_modify_pages(self):
+        """Правка поста и новый комментарий меняют ETag."""
+        responses = {
+            url: self.authorized_client.get(url) for url in self.urls}
+        self.post.text = 'Исправленный пост'
+        self.post.save()
+        for url, response in responses.items():
+            with self.subTest(url=url):
+                response = self.revalidate(
+                    self.authorized_client, url, response)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertContains(response, 'Исправленный пост')
+        url = self.urls[-1]
+        response = self.authorized_client.get(url)
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий')
+        response = self.revalidate(self.authorized_client, url, response)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_comment_changes_modify_post_page(self):
+        """Правка комментария и удаление с новым меняют ETag поста."""
+        url = self.urls[-1]
+        comment = Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий')
+        response = self.authorized_client.get(url)
+        comment.text = 'Исправленный комментарий'
+        comment.save()
+        response = self.revalidate(self.authorized_client, url, response)
+        self.assertContains(response, 'Исправленный комментарий')
+        comment.delete()
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Новый комментарий')
+        response = self.revalidate(self.authorized_client, url, response)
+        self.assertContains(response, 'Новый комментарий')
+
+    def test_etag_depends_on_user(self):
+        """Страница автора не подходит другому пользователю."""
+        url = self.urls[2]
+        response = self.authorized_client.get(url)
+        response = self.revalidate(self.reader_client, url, response)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_etag_depends_on_csrf_token(self):
+        """Новый вход меняет ETag страницы с формой комментария."""
+        url = self.urls[-1]
+        response = self.authorized_client.get(url)
+        self.authorized_client.logout()
+        self.authorized_client.force_login(self.user)
+        response = self.revalidate(self.authorized_client, url, response)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
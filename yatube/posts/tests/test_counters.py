@@ -0,0 +1,79 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from posts.models import Comment, Follow, Group, Post, UserStats
+
+User = get_user_model()
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Luser')
+        cls.reader = User.objects.create_user(username='Lower')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slug',
+            description='Жили-были',
+        )
+
+    def assertCounters(self, obj, **expected):
+        obj.refresh_from_db()
+        for field, value in expected.items():
+            with self.subTest(obj=obj, field=field):
+                self.assertEqual(getattr(obj, field), value)
+
+    def test_post_counters(self):
+        """Посты считаются у автора и группы, в том числе при переносе."""
+        post = Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.group)
+        self.assertCounters(self.user.stats, posts_count=1)
+        self.assertCounters(self.group, posts_count=1)
+        other = Group.objects.create(title='Другая', slug='other')
+        post.group = other
+        post.save()
+        self.assertCounters(self.group, posts_count=0)
+        self.assertCounters(other, posts_count=1)
+        post.delete()
+        self.assertCounters(self.user.stats, posts_count=0)
+        self.assertCounters(other, posts_count=0)
+
+    def test_comment_counters(self):
+        """Комментарии считаются у поста."""
+        post = Post.objects.create(author=self.user, text='Тестовый пост')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий')
+        self.assertCounters(post, comments_count=1)
+        comment.delete()
+        self.assertCounters(post, comments_count=0)
+
+    def test_follow_counters(self):
+        """Подписки считаются у обеих сторон."""
+        follow = Follow.objects.create(user=self.reader, author=self.user)
+        self.assertCounters(self.user.stats, followers_count=1)
+        self.assertCounters(self.reader.stats, following_count=1)
+        follow.delete()
+        self.assertCounters(self.user.stats, followers_count=0)
+        self.assertCounters(self.reader.stats, following_count=0)
+
+    def test_repair_command(self):
+        """Команда находит и исправляет расхождения счетчиков."""
+        post = Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.group)
+        Follow.objects.create(user=self.reader, author=self.user)
+        Group.objects.update(posts_count=7)
+        Post.objects.update(comments_count=3)
+        UserStats.objects.filter(user=self.reader).delete()
+        UserStats.objects.filter(user=self.user).update(followers_count=0)
+        out = StringIO()
+        call_command('repair_counters', batch_size=1, stdout=out)
+        self.assertCounters(self.group, posts_count=1)
+        self.assertCounters(post, comments_count=0)
+        self.assertCounters(self.user.stats, posts_count=1, followers_count=1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 1)
+        self.assertIn('исправлено 2', out.getvalue())
@@ -1,21 +1,26 @@
+import hashlib
 import shutil
 import tempfile
 from http import HTTPStatus
+from io import BytesIO, StringIO
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
 from posts.models import Group, Post, Comment
 
 User = get_user_model()
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+EXIF_ORIENTATION = 0x0112
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_THUMBNAILS_ASYNC=False)
 class PostCreateFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -50,6 +55,10 @@ class PostCreateFormTests(TestCase):
             b'\x0A\x00\x3B'
         )
 
+    def stored_name(self, content):
+        digest = hashlib.sha256(content).hexdigest()
+        return f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif'
+
     def test_login_client_create_post_form(self):
         """Валидная форма создает запись в PostForm."""
         tasks_count = Post.objects.count()
@@ -77,7 +86,7 @@ class PostCreateFormTests(TestCase):
                 text='Экспресс текст',
                 group=self.group,
                 author=self.user,
-                image='posts/small.gif'
+                image=self.stored_name(self.small_gif)
             ).exists()
         )
         self.assertEqual(response.status_code, HTTPStatus.OK)
@@ -124,7 +133,7 @@ class PostCreateFormTests(TestCase):
                 text='Экспресс',
                 group=new_group.id,
                 author=self.user,
-                image='posts/small1.gif'
+                image=self.stored_name(self.small_gif)
             ).exists()
         )
         object = Post.objects.first()
@@ -189,3 +198,67 @@ class PostCreateFormTests(TestCase):
         self.assertRedirects(
             response, f'/auth/login/?next=/posts/{self.post.id}/comment/')
         self.assertEqual(Comment.objects.count(), comment_count)
+
+    def test_forms_store_rendered_text(self):
+        """Формы сохраняют экранированный HTML текста и отрывок."""
+        text = '<b>Первый</b> абзац\n\nВторой абзац, который длиннее отрывка'
+        self.login_client.post(
+            reverse('posts:post_edit', args=(self.post.id,)),
+            data={'text': text, 'group': self.group.id},
+        )
+        self.login_client.post(
+            reverse('posts:add_comment', args=(self.post.id,)),
+            data={'text': text},
+        )
+        self.post.refresh_from_db()
+        for obj in (self.post, Comment.objects.get(post=self.post)):
+            with self.subTest(obj=obj):
+                self.assertEqual(
+                    obj.text_html,
+                    '<p>&lt;b&gt;Первый&lt;/b&gt; абзац</p>\n\n'
+                    '<p>Второй абзац, который длиннее отрывка</p>'
+                )
+                self.assertEqual(len(obj.excerpt), settings.LIMIT_TEXT)
+                self.assertTrue(obj.excerpt.startswith('<b>Первый</b>'))
+
+    def test_render_texts_command(self):
+        """Команда дозаполняет HTML у записей, сохраненных без формы."""
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text='Комментарий')
+        call_command('render_texts', batch_size=1, stdout=StringIO())
+        self.post.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual(self.post.text_html, '<p>Тест текст</p>')
+        self.assertEqual(comment.text_html, '<p>Комментарий</p>')
+
+    def test_uploaded_image_normalized(self):
+        """Загруженная картинка повернута по EXIF, ужата и без EXIF."""
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION] = 6
+        buffer = BytesIO()
+        Image.new('RGB', (6000, 4000), 'red').save(
+            buffer, 'JPEG', exif=exif.tobytes())
+        uploaded = SimpleUploadedFile(
+            name='photo.jpg', content=buffer.getvalue(),
+            content_type='image/jpeg'
+        )
+        self.login_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Фото', 'image': uploaded},
+        )
+        post = Post.objects.get(text='Фото')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (1707, 2560))
+            self.assertNotIn('exif', image.info)
+
+    def test_small_image_kept_as_is(self):
+        """Небольшая картинка без метаданных сохраняется без изменений."""
+        uploaded = SimpleUploadedFile(
+            name='kept.gif', content=self.small_gif, content_type='image/gif')
+        self.login_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Гифка', 'image': uploaded},
+        )
+        post = Post.objects.get(text='Гифка')
+        with open(post.image.path, 'rb') as stored:
+            self.assertEqual(stored.read(), self.small_gif)
@@ -31,7 +31,8 @@ class PostModelTest(TestCase):
         """Проверяем, что у моделей корректно работает __str__."""
         method_str = (
             (self.group, self.group.title,),
-            (self.post, self.post.text[:settings.LIMIT_TEXT_MODEL]),
+            (self.post, self.post.text[:settings.LIMIT_TEXT - 1] + '…'),
+            (self.comment, self.comment.text),
         )
         for model, expected_object_name in method_str:
             with self.subTest(model=model):
@@ -40,6 +41,14 @@ class PostModelTest(TestCase):
                     str(model)
                 )
 
+    def test_str_uses_stored_excerpt(self):
+        """__str__ берет сохраненный отрывок, а не режет текст заново."""
+        post = Post(author=self.user, text='Текст ' * 10)
+        post.render_text()
+        post.text = 'Другой текст'
+        self.assertEqual(str(post), post.excerpt)
+        self.assertEqual(len(str(post)), settings.LIMIT_TEXT)
+
     def test_verbose_name(self):
         """verbose_name в полях совпадает с ожидаемым."""
         field_verboses_post = {
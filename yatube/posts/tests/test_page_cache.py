@@ -0,0 +1,116 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase
+from django.urls import reverse
+
+from core import page_cache
+
+from posts.models import Comment, Group, Post
+
+User = get_user_model()
+
+
+class AnonymousPageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Luser')
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slug',
+            description='Жили-были',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.group)
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+
+    def test_anonymous_pages_served_from_cache(self):
+        """Повторный запрос анонима не доходит до view и базы."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                first = self.guest_client.get(url)
+                with self.assertNumQueries(0):
+                    second = self.guest_client.get(url)
+                self.assertEqual(second.content, first.content)
+
+    def test_authorized_pages_not_cached(self):
+        """Авторизованный пользователь получает страницу от view."""
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        response = self.authorized_client.get(url)
+        self.assertIsNotNone(response.context)
+        self.assertIn('page_obj', response.context)
+
+    def test_post_change_invalidates_pages(self):
+        """Правка поста сбрасывает все страницы, где он показан."""
+        for url in self.urls:
+            self.guest_client.get(url)
+        self.post.text = 'Исправленный пост'
+        self.post.save()
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertContains(
+                    self.guest_client.get(url), 'Исправленный пост')
+
+    def test_related_changes_invalidate_pages(self):
+        """Группа, автор и комментарии сбрасывают зависимые страницы."""
+        group_url, profile_url, detail_url = self.urls[1:]
+        for url in self.urls:
+            self.guest_client.get(url)
+        self.group.title = 'Новый заголовок'
+        self.group.save()
+        self.assertContains(
+            self.guest_client.get(group_url), 'Новый заголовок')
+        self.user.first_name = 'Лев'
+        self.user.save()
+        self.assertContains(self.guest_client.get(profile_url), 'Лев')
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Новый комментарий')
+        self.assertContains(
+            self.guest_client.get(detail_url), 'Новый комментарий')
+
+    def test_new_post_invalidates_feeds(self):
+        """Новый пост появляется в закешированных лентах."""
+        for url in self.urls[:3]:
+            self.guest_client.get(url)
+        Post.objects.create(
+            author=self.user, text='Свежий пост', group=self.group)
+        for url in self.urls[:3]:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url), 'Свежий пост')
+
+    def test_page_not_stored_if_changed_during_render(self):
+        """Страница, чьи данные менялись во время сборки, не кешируется."""
+        request = RequestFactory().get(self.urls[0])
+        started = time.time_ns()
+        page_cache.add_tags(request, f'post:{self.post.pk}')
+        page_cache.invalidate(f'post:{self.post.pk}')
+        page_cache.store(request, HttpResponse('Старая страница'), started)
+        self.assertIsNone(page_cache.fetch(request))
+        started = time.time_ns()
+        page_cache.store(request, HttpResponse('Новая страница'), started)
+        self.assertEqual(
+            page_cache.fetch(request)['content'].decode(), 'Новая страница')
+
+    def test_page_with_csrf_token_not_stored(self):
+        """Страница, бравшая CSRF-токен, не кешируется."""
+        request = RequestFactory().get(self.urls[0])
+        started = time.time_ns()
+        page_cache.add_tags(request, f'post:{self.post.pk}')
+        request.META['CSRF_COOKIE_USED'] = True
+        page_cache.store(request, HttpResponse('С формой'), started)
+        self.assertIsNone(page_cache.fetch(request))
@@ -0,0 +1,108 @@
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+from posts.timeline import celebrities
+
+User = get_user_model()
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN из SQLite')
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Luser')
+        cls.follower = User.objects.create_user(username='Lower')
+        Follow.objects.create(user=cls.follower, author=cls.user)
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slug',
+            description='Жили-были',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text='Тестовый пост', group=cls.group)
+        Comment.objects.create(
+            post=cls.post, author=cls.follower, text='Комментарий')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.follower)
+
+    def query_plans(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        plans = {}
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if sql.startswith('SELECT') and 'ORDER BY' in sql:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                    plans[sql] = ' | '.join(
+                        str(row[-1]) for row in cursor.fetchall())
+        return plans
+
+    def test_views_use_indexes_without_sort(self):
+        """Запросы лент и комментариев идут по индексам без сортировки."""
+        urls = (
+            (reverse('posts:index'), 'post_date_idx'),
+            (reverse('posts:index') + '?cursor=', 'post_date_idx'),
+            (reverse('posts:group_list', args=(self.group.slug,)),
+             'post_group_date_idx'),
+            (reverse('posts:profile', args=(self.user,)),
+             'post_author_date_idx'),
+            (reverse('posts:group_list', args=(self.group.slug,))
+             + '?cursor=', 'post_group_date_idx'),
+            (reverse('posts:profile', args=(self.user,)) + '?cursor=',
+             'post_author_date_idx'),
+            (reverse('posts:follow_index'), 'timeline_user_date_idx'),
+            (reverse('posts:follow_index') + '?cursor=',
+             'timeline_user_date_idx'),
+            (reverse('posts:post_detail', args=(self.post.id,)),
+             'comment_post_created_idx'),
+        )
+        for url, index in urls:
+            with self.subTest(url=url):
+                plans = self.query_plans(url)
+                self.assertTrue(
+                    any(index in plan for plan in plans.values()), plans)
+                for sql, plan in plans.items():
+                    self.assertNotIn('TEMP B-TREE', plan, sql)
+
+    def test_follow_feed_with_pulled_author(self):
+        """Подмешивание популярного автора не ломает чтение ленты по индексу.
+
+        Строки ленты идут по timeline_user_date_idx без сортировки, а оба
+        запроса страницы ограничены LIMIT.
+        """
+        other = User.objects.create_user(username='Other')
+        Follow.objects.create(user=self.follower, author=other)
+        Follow.objects.create(user=other, author=self.user)
+        Post.objects.create(author=other, text='Пост из ленты')
+        with override_settings(TIMELINE_FANOUT_LIMIT=2):
+            cache.clear()
+            self.assertEqual(celebrities(), {self.user.pk})
+            urls = (
+                reverse('posts:follow_index'),
+                reverse('posts:follow_index') + '?cursor=',
+            )
+            for url in urls:
+                with self.subTest(url=url):
+                    plans = self.query_plans(url)
+                    feed = {
+                        sql: plan for sql, plan in plans.items()
+                        if 'posts_post' in sql and 'feed_date' in sql
+                    }
+                    self.assertEqual(len(feed), 2, plans)
+                    for sql, plan in feed.items():
+                        self.assertIn('LIMIT', sql)
+                        if 'posts_timeline' in sql:
+                            self.assertIn('timeline_user_date_idx', plan)
+                            self.assertNotIn('TEMP B-TREE', plan, sql)
@@ -0,0 +1,92 @@
+from http import HTTPStatus
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Post
+from posts.search import SearchResults, build_query
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='Luser')
+        cls.rare = Post.objects.create(
+            author=cls.user, text='Ежик шел по лесу и нашел грибы.')
+        cls.frequent = Post.objects.create(
+            author=cls.user, text='Ежик, ежик, ежики: ежик ищет ежика.')
+        Post.objects.create(author=cls.user, text='Про котов.')
+
+    def setUp(self):
+        self.client = Client()
+
+    def search(self, text):
+        return [post.pk for post in SearchResults(text)[:10]]
+
+    def test_index_follows_posts(self):
+        """Триггеры обновляют индекс при создании, правке и удалении."""
+        post = Post.objects.create(author=self.user, text='Барсук')
+        self.assertEqual(self.search('барсук'), [post.pk])
+        post.text = 'Енот'
+        post.save()
+        self.assertEqual(self.search('барсук'), [])
+        self.assertEqual(self.search('енот'), [post.pk])
+        post.delete()
+        self.assertEqual(self.search('енот'), [])
+
+    def test_ranked_prefix_search(self):
+        """Частые совпадения выше, слова ищутся по началу."""
+        self.assertEqual(
+            self.search('ЕЖИК'), [self.frequent.pk, self.rare.pk])
+        self.assertEqual(self.search('гриб'), [self.rare.pk])
+        self.assertEqual(self.search('ежик грибы'), [self.rare.pk])
+
+    def test_query_syntax_is_escaped(self):
+        """Операторы FTS5 во вводе не ломают запрос."""
+        self.assertEqual(
+            build_query('ежик" OR NEAR(*'), '"ежик"* "OR"* "NEAR"*')
+        self.assertEqual(self.search('"'), [])
+        self.assertEqual(SearchResults('  ').count(), 0)
+
+    def test_snippet_escaped_and_highlighted(self):
+        """Фрагмент экранирован, совпадения подсвечены."""
+        post = Post.objects.create(
+            author=self.user, text='<script>alert(1)</script> хорек')
+        found = SearchResults('хорек')[:1][0]
+        snippet = found.snippet
+        self.assertEqual(found, post)
+        self.assertIn('&lt;script&gt;', snippet)
+        self.assertIn('<mark>хорек</mark>', snippet)
+
+    @override_settings(PAGINATOR_POST_LIMIT=1)
+    def test_search_page(self):
+        """Страница поиска листается с сохранением запроса."""
+        response = self.client.get(reverse('posts:search'), {'q': 'ежик'})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.paginator.count, 2)
+        self.assertEqual(list(page_obj), [self.frequent])
+        self.assertContains(
+            response, '?q=%D0%B5%D0%B6%D0%B8%D0%BA&amp;page=2')
+        response = self.client.get(
+            reverse('posts:search'), {'q': 'ежик', 'page': 2})
+        self.assertEqual(list(response.context['page_obj']), [self.rare])
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идет по индексу FTS5."""
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('admin:posts_post_changelist'), {'q': 'гриб'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.rare])
+        self.assertTrue(any(
+            'posts_post_fts' in query['sql']
+            for query in queries.captured_queries))
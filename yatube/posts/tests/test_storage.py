@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from core.models import StoredFile
+from core.storage import is_hashed
+from posts.models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_THUMBNAILS_ASYNC=False)
+@mock.patch.object(
+    transaction, 'on_commit', side_effect=lambda callback: callback())
+class PostImageStorageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Luser')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def upload(self, content):
+        return SimpleUploadedFile(
+            name='image.gif', content=content, content_type='image/gif')
+
+    def create_post(self, content):
+        return Post.objects.create(
+            author=self.user, text='Пост', image=self.upload(content))
+
+    def test_same_image_shared_between_posts(self, on_commit):
+        """Одна картинка в двух постах хранится одним файлом."""
+        first = self.create_post(b'same')
+        second = self.create_post(b'same')
+        self.assertEqual(first.image.name, second.image.name)
+        first.delete()
+        self.assertTrue(second.image.storage.exists(second.image.name))
+        second.delete()
+        self.assertFalse(second.image.storage.exists(second.image.name))
+
+    def test_replaced_image_released(self, on_commit):
+        """Замена картинки отпускает старый файл, повторная загрузка
+        той же картинки не добавляет лишней ссылки.
+        """
+        post = self.create_post(b'old')
+        old_name = post.image.name
+        post.image = self.upload(b'old')
+        post.save()
+        self.assertEqual(
+            StoredFile.objects.get(name=old_name).references, 1)
+        post.image = self.upload(b'new')
+        post.save()
+        self.assertFalse(post.image.storage.exists(old_name))
+        self.assertTrue(post.image.storage.exists(post.image.name))
+
+    def test_shard_images_command(self, on_commit):
+        """Команда переносит старые картинки в хранилище по хешу."""
+        directory = os.path.join(TEMP_MEDIA_ROOT, 'posts')
+        os.makedirs(directory, exist_ok=True)
+        for name in ('legacy1.gif', 'legacy2.gif'):
+            with open(os.path.join(directory, name), 'wb') as image:
+                image.write(b'legacy')
+        posts = [
+            Post.objects.create(
+                author=self.user, text='Пост', image=f'posts/{name}')
+            for name in ('legacy1.gif', 'legacy2.gif', 'legacy1.gif')
+        ]
+        out = StringIO()
+        call_command('shard_images', batch_size=2, stdout=out)
+        self.assertIn('Перенесено 3, без файла 0', out.getvalue())
+        names = {
+            name for name in Post.objects.filter(
+                pk__in=[post.pk for post in posts]).values_list(
+                    'image', flat=True)
+        }
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(is_hashed(name))
+        self.assertEqual(StoredFile.objects.get(name=name).references, 3)
+        for legacy in ('legacy1.gif', 'legacy2.gif'):
+            with self.subTest(legacy=legacy):
+                self.assertFalse(
+                    os.path.exists(os.path.join(directory, legacy)))
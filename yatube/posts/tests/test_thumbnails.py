@@ -0,0 +1,296 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.engines.pil_engine import Engine
+
+from posts import thumbnails
+from posts.management.commands.benchmark_thumbnails import make_fixture
+from posts.management.commands.generate_thumbnails import CHECKPOINT_KEY
+from posts.models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_THUMBNAILS_ASYNC=False)
+class ThumbnailsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Luser')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def upload(self, name):
+        # Одинаковые картинки хранилище сольет в один файл, поэтому
+        # у каждой загрузки свое содержимое.
+        content = BytesIO()
+        Image.new('L', (2, 1)).save(content, 'GIF', comment=name.encode())
+        return SimpleUploadedFile(
+            name=name, content=content.getvalue(), content_type='image/gif')
+
+    @override_settings(POST_THUMBNAILS_ASYNC=True)
+    def test_create_post_generates_thumbnails(self):
+        """После создания поста миниатюры всех размеров уже готовы."""
+        with mock.patch.object(
+                thumbnails.transaction, 'on_commit',
+                side_effect=lambda callback: callback()), \
+                mock.patch.object(
+                    thumbnails.executor, 'submit',
+                    side_effect=lambda func, *args: func(*args)):
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Пост', 'image': self.upload('eager.gif')},
+            )
+        post = Post.objects.get(text='Пост')
+        for name, thumbnail in thumbnails.get_variants(
+                post.image, thumbnails.variants()).items():
+            with self.subTest(name=name):
+                self.assertIsNotNone(thumbnail)
+
+    def test_queue_without_executor(self):
+        """Без POST_THUMBNAILS_ASYNC миниатюры создаются в on_commit."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=self.upload('sync.gif'))
+        with mock.patch.object(
+                thumbnails.transaction, 'on_commit',
+                side_effect=lambda callback: callback()), \
+                mock.patch.object(thumbnails.executor, 'submit') as submit:
+            thumbnails.queue(post)
+        submit.assert_not_called()
+        found = thumbnails.get_variants(post.image, thumbnails.variants())
+        self.assertTrue(all(found.values()))
+
+    def test_cached_pages_updated_after_thumbnails(self):
+        """Закешированные с исходной картинкой страницы получают миниатюры."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=self.upload('late.gif'))
+        url = reverse('posts:index')
+        clients = (Client(), self.authorized_client)
+        for client in clients:
+            self.assertNotContains(client.get(url), '<picture>')
+        with mock.patch.object(
+                thumbnails.transaction, 'on_commit',
+                side_effect=lambda callback: callback()):
+            thumbnails.queue(post)
+        for client in clients:
+            with self.subTest(client=client):
+                self.assertContains(client.get(url), '<picture>')
+
+    def test_generate_thumbnails_updates_cached_pages(self):
+        """Команда сбрасывает кеш карточек, собранных без миниатюр."""
+        Post.objects.create(
+            author=self.user, text='Пост', image=self.upload('cmd.gif'))
+        url = reverse('posts:index')
+        self.assertNotContains(Client().get(url), '<picture>')
+        call_command('generate_thumbnails', workers=1, stdout=StringIO())
+        self.assertContains(Client().get(url), '<picture>')
+
+    def test_pages_read_existing_thumbnails(self):
+        """Страницы только читают метаданные готовых миниатюр."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=self.upload('ready.gif'))
+        thumbnails.generate(post.image)
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:post_detail', args=(post.pk,)),
+        )
+        with mock.patch.object(
+                default.backend, 'get_thumbnail') as get_thumbnail:
+            for url in urls:
+                with self.subTest(url=url):
+                    response = self.authorized_client.get(url)
+                    self.assertContains(response, '<picture>')
+        get_thumbnail.assert_not_called()
+
+    def test_feed_thumbnails_fetched_in_one_batch(self):
+        """Миниатюры ленты загружаются одним обращением к хранилищу."""
+        for number in range(3):
+            post = Post.objects.create(
+                author=self.user, text=f'Пост {number}',
+                image=self.upload(f'batch{number}.gif'))
+            thumbnails.generate(post.image)
+        cache.clear()
+        with mock.patch.object(
+                default.kvstore, '_get_raw') as get_raw, \
+                mock.patch.object(
+                    default.kvstore.cache, 'get_many',
+                    wraps=default.kvstore.cache.get_many) as get_many, \
+                mock.patch.object(
+                    default.backend, 'get_thumbnail') as get_thumbnail:
+            response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, '<picture>', count=3)
+        get_raw.assert_not_called()
+        get_thumbnail.assert_not_called()
+        self.assertEqual(get_many.call_count, 1)
+
+    def test_missing_thumbnail_not_created_on_render(self):
+        """Без готовых миниатюр страница показывает исходную картинку."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=self.upload('legacy.gif'))
+        with mock.patch.object(
+                default.engine, 'get_image') as get_image:
+            response = self.authorized_client.get(
+                reverse('posts:post_detail', args=(post.pk,)))
+        get_image.assert_not_called()
+        self.assertNotContains(response, '<picture>')
+        self.assertContains(response, f'src="{post.image.url}"')
+        self.assertFalse(any(
+            thumbnails.get_variants(post.image, thumbnails.variants())
+            .values()))
+
+    def test_variants_from_one_decode(self):
+        """Все варианты картинки создаются из одного декодирования."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=self.upload('variants.gif'))
+        with mock.patch.object(
+                default.engine, 'get_image',
+                wraps=default.engine.get_image) as get_image:
+            thumbnails.generate(post.image)
+        get_image.assert_called_once()
+        found = thumbnails.get_variants(post.image, thumbnails.variants())
+        self.assertTrue(all(found.values()))
+
+    def test_picture_tag(self):
+        """Тег выдает img с srcset по всем ширинам и ленивой загрузкой."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=self.upload('picture.gif'))
+        thumbnails.generate(post.image)
+        html = Template(
+            '{% load post_thumbnails %}{% post_picture image "card" %}'
+        ).render(Context({'image': post.image}))
+        self.assertIn('<img class="card"', html)
+        self.assertIn('loading="lazy"', html)
+        self.assertIn(f'sizes="{settings.POST_IMAGE_SIZES}"', html)
+        for width in settings.POST_IMAGE_WIDTHS:
+            with self.subTest(width=width):
+                self.assertIn(f' {width}w', html)
+        for image_format in thumbnails.image_formats():
+            if image_format == 'JPEG':
+                continue
+            with self.subTest(image_format=image_format):
+                self.assertIn(
+                    f'<source type="image/{image_format.lower()}"', html)
+
+    def test_generate_thumbnails_command(self):
+        """Команда создает недостающие миниатюры и пропускает готовые."""
+        posts = [
+            Post.objects.create(
+                author=self.user, text=f'Пост {number}',
+                image=self.upload(f'backlog{number}.gif'))
+            for number in range(3)
+        ]
+        thumbnails.generate(posts[0].image)
+        out = StringIO()
+        call_command(
+            'generate_thumbnails', workers=2, batch_size=2, stdout=out)
+        self.assertIn('3/3: создано 2, пропущено 1, ошибок 0', out.getvalue())
+        for post in posts:
+            with self.subTest(post=post):
+                found = thumbnails.get_variants(
+                    post.image, thumbnails.variants())
+                self.assertTrue(all(found.values()))
+        self.assertIsNone(cache.get(CHECKPOINT_KEY))
+
+    def test_generate_thumbnails_force_rewrites_files(self):
+        """С --force готовые миниатюры перезаписываются на месте."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=self.upload('force.gif'))
+        thumbnails.generate(post.image)
+        names = [
+            thumbnail.name for thumbnail in thumbnails.get_variants(
+                post.image, thumbnails.variants()).values()
+        ]
+        for name in names:
+            with default.storage.open(name, 'wb') as thumbnail:
+                thumbnail.write(b'stale')
+        out = StringIO()
+        call_command('generate_thumbnails', workers=1, force=True, stdout=out)
+        self.assertIn('1/1: создано 1, пропущено 0', out.getvalue())
+        for name in names:
+            with self.subTest(name=name):
+                with default.storage.open(name) as thumbnail:
+                    self.assertNotEqual(thumbnail.read(), b'stale')
+                    thumbnail.seek(0)
+                    Image.open(thumbnail).verify()
+        directory = os.path.dirname(default.storage.path(names[0]))
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_generate_thumbnails_resumes(self):
+        """Прерванный запуск продолжается после сохраненного поста."""
+        first, second = (
+            Post.objects.create(
+                author=self.user, text=f'Пост {number}',
+                image=self.upload(f'resume{number}.gif'))
+            for number in range(2)
+        )
+        cache.set(CHECKPOINT_KEY, first.pk, None)
+        out = StringIO()
+        call_command('generate_thumbnails', workers=1, stdout=out)
+        self.assertIn('1/1: создано 1', out.getvalue())
+        found = thumbnails.get_variants(first.image, thumbnails.variants())
+        self.assertFalse(any(found.values()))
+
+
+class DraftEngineTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'large.jpg')
+        make_fixture(self.path, 4800, 3200, 0)
+        self.options = dict(
+            ThumbnailBackend.default_options, crop='center', upscale=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def create(self, engine):
+        image = Image.open(self.path)
+        return image, engine.create(image, (900, 339), self.options)
+
+    def test_draft_decodes_jpeg_at_reduced_scale(self):
+        """JPEG декодируется уменьшенным, а миниатюра того же размера."""
+        source, thumbnail = self.create(thumbnails.DraftEngine())
+        self.assertEqual(source.size, (2400, 1600))
+        _, expected = self.create(Engine())
+        self.assertEqual(thumbnail.size, expected.size)
+
+    def test_reduce_before_resize(self):
+        """Не-JPEG перед точным resize грубо уменьшается reduce()."""
+        image = Image.new('RGB', (4000, 3000))
+        with mock.patch.object(
+                Image.Image, 'reduce', autospec=True,
+                side_effect=Image.Image.reduce) as reduce:
+            scaled = thumbnails.DraftEngine()._scale(image, 400, 300)
+        reduce.assert_called_once_with(image, 5)
+        self.assertEqual(scaled.size, (400, 300))
+
+    def test_benchmark_command(self):
+        """Бенчмарк выводит строку по каждому движку."""
+        out = StringIO()
+        call_command(
+            'benchmark_thumbnails', images=1, size='1200x800', stdout=out)
+        self.assertIn('pil', out.getvalue())
+        self.assertIn('draft', out.getvalue())
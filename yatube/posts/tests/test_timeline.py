@@ -0,0 +1,137 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from posts.models import Follow, Post, Timeline
+from posts.timeline import backfill, celebrities, fan_out, follow_feed
+from posts.utils import CursorPaginator
+
+User = get_user_model()
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Luser')
+        cls.follower = User.objects.create_user(username='Lower')
+        cls.stranger = User.objects.create_user(username='Goblin')
+        cls.old_post = Post.objects.create(
+            author=cls.author, text='Старый пост')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_new_post_fan_out(self):
+        """Новый пост попадает только в ленты подписчиков."""
+        Follow.objects.create(user=self.follower, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertTrue(
+            Timeline.objects.filter(user=self.follower, post=post).exists())
+        self.assertFalse(
+            Timeline.objects.filter(user=self.stranger, post=post).exists())
+        self.assertEqual(list(follow_feed(self.follower)),
+                         [post, self.old_post])
+
+    def test_follow_backfill_and_unfollow_prune(self):
+        """Подписка заполняет ленту, отписка ее очищает."""
+        follow = Follow.objects.create(user=self.follower, author=self.author)
+        self.assertEqual(list(follow_feed(self.follower)), [self.old_post])
+        follow.delete()
+        self.assertFalse(Timeline.objects.filter(user=self.follower).exists())
+        self.assertFalse(follow_feed(self.follower).exists())
+
+    def test_repeated_fan_out_and_backfill(self):
+        """Повторная раскладка не падает на уже записанных строках."""
+        Follow.objects.create(user=self.follower, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        fan_out(post)
+        backfill(self.follower, self.author)
+        self.assertEqual(list(follow_feed(self.follower)),
+                         [post, self.old_post])
+
+    def test_post_delete_removes_entries(self):
+        """Удаление поста убирает его из лент."""
+        Follow.objects.create(user=self.follower, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        post.delete()
+        self.assertEqual(list(follow_feed(self.follower)), [self.old_post])
+
+
+@override_settings(TIMELINE_FANOUT_LIMIT=2, TIMELINE_RECENT_POSTS=5)
+class HybridTimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Luser')
+        cls.readers = [
+            User.objects.create_user(username=f'Reader{i}') for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_celebrity_posts_are_pulled(self):
+        """Посты автора выше порога не раскладываются, но видны в ленте."""
+        for reader in self.readers[:2]:
+            Follow.objects.create(user=reader, author=self.author)
+        self.assertIn(self.author.pk, celebrities())
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertFalse(Timeline.objects.filter(post=post).exists())
+        for reader in self.readers[:2]:
+            with self.subTest(reader=reader):
+                self.assertEqual(list(follow_feed(reader)), [post])
+        self.assertFalse(follow_feed(self.readers[2]).exists())
+
+    def test_pulled_posts_merged_by_date(self):
+        """Посты ленты и подмешанные идут по дате на всех страницах."""
+        regular = User.objects.create_user(username='Regular')
+        reader = self.readers[0]
+        for follower in self.readers[:2]:
+            Follow.objects.create(user=follower, author=self.author)
+        Follow.objects.create(user=reader, author=regular)
+        posts = [
+            Post.objects.create(
+                author=(self.author, regular)[number % 2],
+                text=f'Пост {number}')
+            for number in range(7)
+        ]
+        expected = posts[::-1]
+        feed = follow_feed(reader)
+        self.assertEqual(feed.count(), len(expected))
+        self.assertEqual(list(feed), expected)
+        self.assertEqual(feed[2:5], expected[2:5])
+        paginator = CursorPaginator(
+            feed, 3, keys=('feed_date', 'feed_id'))
+        page = paginator.get_page(None)
+        pages = [list(page)]
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            pages.append(list(page))
+        self.assertEqual(sum(pages, []), expected)
+        back = paginator.get_page(page.previous_cursor)
+        self.assertEqual(list(back), pages[-2])
+
+    def test_drop_below_limit_backfills(self):
+        """При падении ниже порога ленты подписчиков дозаполняются."""
+        for reader in self.readers[:2]:
+            Follow.objects.create(user=reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        Follow.objects.filter(user=self.readers[1]).delete()
+        self.assertNotIn(self.author.pk, celebrities())
+        self.assertTrue(Timeline.objects.filter(
+            user=self.readers[0], post=post).exists())
+        self.assertEqual(list(follow_feed(self.readers[0])), [post])
+        self.assertFalse(follow_feed(self.readers[1]).exists())
+
+    def test_benchmark_command(self):
+        """Бенчмарк отрабатывает по обе стороны порога и все откатывает."""
+        out = StringIO()
+        call_command(
+            'benchmark_timeline', followers=[1, 3], posts=2, history=20,
+            stdout=out)
+        self.assertIn('push', out.getvalue())
+        self.assertIn('pull', out.getvalue())
+        self.assertFalse(Post.objects.exists())
@@ -0,0 +1,90 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from posts.models import Follow, Group, Post
+from posts.utils import CachedCountPaginator, feed_key
+
+User = get_user_model()
+
+
+class CachedCountPaginatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Luser')
+        cls.follower = User.objects.create_user(username='Lower')
+        Follow.objects.create(user=cls.follower, author=cls.user)
+        cls.group = Group.objects.create(
+            title='Тестовый заголовок',
+            slug='test-slug',
+            description='Жили-были',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Тестовый пост',
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def feeds(self):
+        return (
+            (feed_key('index'), Post.objects.all()),
+            (feed_key('group', self.group.pk), self.group.posts.all()),
+            (feed_key('author', self.user.pk), self.user.posts.all()),
+            (feed_key('follow', self.follower.pk), Post.objects.filter(
+                author__following__user=self.follower)),
+        )
+
+    def test_count_is_cached(self):
+        """Повторный подсчет ленты не ходит в базу."""
+        for feed, posts in self.feeds():
+            with self.subTest(feed=feed):
+                self.assertEqual(
+                    CachedCountPaginator(posts, 10, feed=feed).count, 1)
+                with self.assertNumQueries(0):
+                    self.assertEqual(
+                        CachedCountPaginator(posts, 10, feed=feed).count, 1)
+
+    def test_count_invalidated_on_save_and_delete(self):
+        """Создание и удаление поста сбрасывает счетчики его лент."""
+        for feed, posts in self.feeds():
+            CachedCountPaginator(posts, 10, feed=feed).count
+        new_post = Post.objects.create(
+            author=self.user, text='Новый пост', group=self.group)
+        for feed, posts in self.feeds():
+            with self.subTest(feed=feed):
+                self.assertEqual(
+                    CachedCountPaginator(posts, 10, feed=feed).count, 2)
+        new_post.delete()
+        for feed, posts in self.feeds():
+            with self.subTest(feed=feed):
+                self.assertEqual(
+                    CachedCountPaginator(posts, 10, feed=feed).count, 1)
+
+    def test_count_invalidated_on_group_change(self):
+        """Перенос поста в другую группу сбрасывает счетчик старой."""
+        feed = feed_key('group', self.group.pk)
+        CachedCountPaginator(self.group.posts.all(), 10, feed=feed).count
+        self.post.group = None
+        self.post.save()
+        self.assertEqual(
+            CachedCountPaginator(
+                self.group.posts.all(), 10, feed=feed).count, 0)
+
+    def test_elided_page_range(self):
+        """Список страниц не зависит от размера ленты."""
+        paginator = CachedCountPaginator(list(range(1000)), 10)
+        paginator.get_page(50)
+        self.assertEqual(
+            paginator.elided_page_range,
+            [1, '…', 48, 49, 50, 51, 52, '…', 100]
+        )
+        paginator.get_page(1)
+        self.assertEqual(
+            paginator.elided_page_range, [1, 2, 3, '…', 100])
+        paginator = CachedCountPaginator(list(range(30)), 10)
+        paginator.get_page(2)
+        self.assertEqual(paginator.elided_page_range, [1, 2, 3])
@@ -3,12 +3,12 @@ from http import HTTPStatus
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.cache import cache
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
 from posts.forms import PostForm, CommentForm
 from posts.models import Group, Follow, Post, Comment
+from posts.utils import bump_feed_version, next_cursor
 
 
 User = get_user_model()
@@ -139,6 +139,34 @@ class PostPagesTests(TestCase):
         comment_text = comment.text
         self.assertEqual(comment_text, self.comment.text)
 
+    @override_settings(PAGINATOR_COMMENT_LIMIT=2)
+    def test_comments_loaded_by_pages(self):
+        """Пост показывает первые комментарии, остальные догружаются."""
+        for number in range(4):
+            Comment.objects.create(
+                post=self.post, text=f'Комментарий {number}',
+                author=self.user)
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', args=(self.post.id,)))
+        comments = response.context['comments']
+        self.assertEqual(
+            [comment.text for comment in comments],
+            ['Комментарий 3', 'Комментарий 2'])
+        more_url = reverse('posts:post_comments', args=(self.post.id,))
+        self.assertContains(
+            response, f'{more_url}?cursor={comments.next_cursor}')
+        texts = []
+        cursor = comments.next_cursor
+        while cursor:
+            response = self.authorized_client.get(
+                more_url, {'cursor': cursor})
+            self.assertTemplateNotUsed(response, 'base.html')
+            page = response.context['comments']
+            texts += [comment.text for comment in page]
+            cursor = page.next_cursor
+        self.assertEqual(
+            texts, ['Комментарий 1', 'Комментарий 0', self.comment.text])
+
     def test_show_comment_in_page(self):
         """Проверка что комментарий появляется на странице."""
         response = (self.authorized_client.get(reverse(
@@ -184,13 +212,83 @@ class PostPagesTests(TestCase):
         )
         response = self.authorized_client.get(reverse('posts:index'))
         temp = response.content
-        new_post.delete()
+        Post.objects.filter(pk=new_post.pk).update(text='Без сигналов')
         response = self.authorized_client.get(reverse('posts:index'))
         self.assertEqual(response.content, temp)
-        cache.clear()
+        new_post.delete()
         response = self.authorized_client.get(reverse('posts:index'))
         self.assertNotEqual(response.content, temp)
 
+    def test_feed_pages_single_flight(self):
+        """index и group_list отдаются из кеша до сдвига версии лент."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                bump_feed_version()
+                first = self.authorized_client.get(url)
+                self.assertIsNotNone(first.context)
+                second = self.authorized_client.get(url)
+                self.assertIsNone(second.context)
+                self.assertEqual(second.content, first.content)
+                bump_feed_version()
+                self.assertIsNotNone(
+                    self.authorized_client.get(url).context)
+
+    def test_cache_feeds_invalidated_by_version(self):
+        """Фрагменты лент сбрасываются сразу после изменения контента."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.user,)),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.follower_client.get(url)
+                self.assertNotContains(response, 'Свежий пост')
+                new_post = Post.objects.create(
+                    author=self.user, text='Свежий пост', group=self.group)
+                response = self.follower_client.get(url)
+                self.assertContains(response, 'Свежий пост')
+                new_post.delete()
+                response = self.follower_client.get(url)
+                self.assertNotContains(response, 'Свежий пост')
+
+    def test_post_cards_cached(self):
+        """Карточка поста кешируется, правка сбрасывает только ее."""
+        edited = Post.objects.create(author=self.user, text='Первый пост')
+        kept = Post.objects.create(author=self.user, text='Второй пост')
+        url = reverse('posts:index')
+        self.authorized_client.get(url)
+        Post.objects.filter(pk__in=(edited.pk, kept.pk)).update(
+            text='Без сигналов')
+        bump_feed_version()
+        response = self.authorized_client.get(url)
+        self.assertContains(response, 'Первый пост')
+        self.assertContains(response, 'Второй пост')
+        self.authorized_client.post(
+            reverse('posts:post_edit', args=(edited.pk,)),
+            data={'text': 'Исправленный пост'},
+        )
+        response = self.authorized_client.get(url)
+        self.assertContains(response, 'Исправленный пост')
+        self.assertNotContains(response, 'Первый пост')
+        self.assertContains(response, 'Второй пост')
+
+    def test_post_cards_respect_context_flags(self):
+        """Одна карточка в разных лентах учитывает флаги author и group."""
+        self.authorized_client.get(reverse('posts:index'))
+        profile_url = reverse('posts:profile', args=(self.user,))
+        group_url = reverse('posts:group_list', args=(self.group.slug,))
+        response = self.authorized_client.get(profile_url)
+        self.assertNotContains(response, f'href="{profile_url}">Автор')
+        self.assertContains(response, f'href="{group_url}"')
+        response = self.authorized_client.get(group_url)
+        self.assertNotContains(response, 'все записи группы')
+
     def test_follow_index_show_context(self):
         """Шаблон follow_index сформирован с правильным контекстом."""
         response = self.follower_client.get(reverse('posts:follow_index'))
@@ -276,3 +374,64 @@ class PaginatorViewsTest(TestCase):
                             reverse(name, args=arg) + page)
                         self.assertEqual(
                             len(response.context['page_obj']), count)
+
+    def test_cursor_pages(self):
+        """Курсорная пагинация листает ленты вперед и назад."""
+        for name, arg in self.template:
+            with self.subTest(name=name):
+                url = reverse(name, args=arg)
+                first = self.follower_client.get(url + '?cursor=')
+                first_page = first.context['page_obj']
+                self.assertEqual(
+                    len(first_page), settings.PAGINATOR_POST_LIMIT)
+                self.assertFalse(first_page.has_previous())
+                second = self.follower_client.get(
+                    f'{url}?cursor={first_page.next_cursor}')
+                second_page = second.context['page_obj']
+                self.assertEqual(
+                    len(second_page),
+                    settings.PAGINATOR_POST_CREATE
+                    - settings.PAGINATOR_POST_LIMIT
+                )
+                self.assertFalse(second_page.has_next())
+                back = self.follower_client.get(
+                    f'{url}?cursor={second_page.previous_cursor}')
+                self.assertEqual(
+                    list(back.context['page_obj']), list(first_page))
+
+    def test_cursor_broken_token(self):
+        """Битый курсор открывает первую страницу ленты."""
+        response = self.follower_client.get(
+            reverse('posts:index') + '?cursor=broken')
+        self.assertEqual(
+            len(response.context['page_obj']), settings.PAGINATOR_POST_LIMIT)
+
+    def test_feed_fragments(self):
+        """Догрузка ленты отдает только карточки следующей страницы."""
+        fragments = (
+            ('posts:index_feed', None),
+            ('posts:group_feed', (self.group.slug,)),
+            ('posts:profile_feed', (self.user,)),
+            ('posts:follow_feed', None),
+        )
+        for (name, arg), (fragment, fragment_arg) in zip(
+                self.template, fragments):
+            with self.subTest(name=fragment):
+                response = self.follower_client.get(reverse(name, args=arg))
+                cursor = next_cursor(response.context['page_obj'])
+                more_url = reverse(fragment, args=fragment_arg)
+                self.assertContains(
+                    response, f'data-load-more="{more_url}?cursor={cursor}"')
+                response = self.follower_client.get(
+                    more_url, {'cursor': cursor})
+                self.assertTemplateUsed(
+                    response, 'posts/includes/feed_page.html')
+                self.assertTemplateNotUsed(response, 'base.html')
+                page_obj = response.context['page_obj']
+                self.assertEqual(
+                    len(page_obj),
+                    settings.PAGINATOR_POST_CREATE
+                    - settings.PAGINATOR_POST_LIMIT
+                )
+                self.assertFalse(page_obj.has_next())
+                self.assertNotContains(response, 'data-load-more')
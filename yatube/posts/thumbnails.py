@@ -0,0 +1,328 @@
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.engines import pil_engine
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import (
+    EMPTY_VALUE, KVStore as CachedDBKVStore,
+)
+from sorl.thumbnail.models import KVStore as KVStoreModel
+from sorl.thumbnail.parsers import parse_geometry
+
+from core import page_cache
+
+from .models import Post
+from .utils import bump_feed_version
+
+logger = logging.getLogger(__name__)
+
+# Во сколько раз промежуточная картинка остается больше итоговой, чтобы
+# точный resize после грубого уменьшения не терял в качестве.
+REDUCING_GAP = 2
+REDUCIBLE_MODES = ('L', 'LA', 'RGB', 'RGBA', 'CMYK')
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.THUMBNAIL_WORKERS, thread_name_prefix='thumbnails')
+
+
+class PostThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, умеющий искать миниатюру без ее создания."""
+
+    def full_options(self, source, options):
+        """Параметры миниатюры, дополненные так же, как в get_thumbnail."""
+        options = dict(options)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        return options
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """Исходник и файл миниатюры с тем же именем, что у get_thumbnail."""
+        source = ImageFile(file_)
+        options = self.full_options(source, options)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return source, ImageFile(name, default.storage)
+
+    def get_existing(self, file_, geometry_string, **options):
+        """Метаданные готовой миниатюры из хранилища ключей или None."""
+        _, thumbnail = self.thumbnail_file(file_, geometry_string, **options)
+        return default.kvstore.get(thumbnail)
+
+    def get_thumbnails(self, file_, variants, force=False):
+        """Как get_thumbnail для пар (геометрия, параметры), но исходник
+        декодируется один раз на все недостающие миниатюры.
+
+        С force пересоздаются и готовые миниатюры: файлы перезаписываются
+        под теми же именами, метаданные обновляются.
+        """
+        source = ImageFile(file_)
+        thumbnails = []
+        todo = {}
+        for geometry_string, options in variants:
+            options = self.full_options(source, options)
+            thumbnail = ImageFile(
+                self._get_thumbnail_filename(
+                    source, geometry_string, options),
+                default.storage,
+            )
+            cached = None if force else default.kvstore.get(thumbnail)
+            if cached:
+                thumbnails.append(cached)
+            else:
+                thumbnails.append(thumbnail)
+                todo.setdefault(
+                    thumbnail.name, (geometry_string, options, thumbnail))
+        if not todo:
+            return thumbnails
+        source_image = default.engine.get_image(source)
+        try:
+            image_info = default.engine.get_image_info(source_image)
+            source.set_size(default.engine.get_image_size(source_image))
+            # Крупные первыми: DraftEngine декодирует исходник под самую
+            # большую миниатюру, остальные режутся из него же.
+            for geometry_string, options, thumbnail in sorted(
+                    todo.values(), reverse=True,
+                    key=lambda job: self._area(source_image, *job[:2])):
+                if thumbnail.exists():
+                    if not (force or sorl_settings.THUMBNAIL_FORCE_OVERWRITE):
+                        continue
+                    self._delete_files(thumbnail)
+                options['image_info'] = image_info
+                self._create_thumbnail(
+                    source_image, geometry_string, options, thumbnail)
+                self._create_alternative_resolutions(
+                    source_image, geometry_string, options, thumbnail.name)
+        finally:
+            default.engine.cleanup(source_image)
+        default.kvstore.get_or_set(source)
+        for _, _, thumbnail in todo.values():
+            default.kvstore.set(thumbnail, source)
+        return thumbnails
+
+    def _delete_files(self, thumbnail):
+        """Удаляет файлы миниатюры перед перезаписью.
+
+        FileSystemStorage не пишет поверх существующего файла, а сохраняет
+        новый под другим именем, которого не знает хранилище ключей.
+        """
+        name, extension = os.path.splitext(thumbnail.name)
+        thumbnail.delete()
+        for resolution in sorl_settings.THUMBNAIL_ALTERNATIVE_RESOLUTIONS:
+            default.storage.delete(f'{name}@{resolution}x{extension}')
+
+    def _area(self, source_image, geometry_string, options):
+        ratio = default.engine.get_image_ratio(source_image, options)
+        width, height = parse_geometry(geometry_string, ratio)
+        return (width or 0) * (height or 0)
+
+
+class DraftEngine(pil_engine.Engine):
+    """PIL-движок sorl, который не декодирует большие картинки целиком.
+
+    JPEG декодируется сразу в уменьшенном масштабе через draft(),
+    остальные форматы перед точным resize грубо сжимаются reduce().
+    """
+
+    def create(self, image, geometry, options):
+        if not options.get('cropbox'):
+            self.draft(image, geometry, options)
+        return super().create(image, geometry, options)
+
+    def draft(self, image, geometry, options):
+        if image.format != 'JPEG':
+            return
+        x_image, y_image = image.size
+        if self.flip_dimensions(image, options=options):
+            x_image, y_image = y_image, x_image
+        factor = self._calculate_scaling_factor(
+            x_image, y_image, geometry, options)
+        # Картинки дополнительных разрешений режутся из того же исходника.
+        factor *= REDUCING_GAP * max(
+            (1, *sorl_settings.THUMBNAIL_ALTERNATIVE_RESOLUTIONS))
+        if factor < 1:
+            width, height = image.size
+            image.draft(
+                image.mode,
+                (math.ceil(width * factor), math.ceil(height * factor)))
+
+    def _scale(self, image, width, height):
+        factor = min(
+            image.size[0] // width, image.size[1] // height) // REDUCING_GAP
+        if factor > 1 and image.mode in REDUCIBLE_MODES:
+            image = image.reduce(factor)
+        return super()._scale(image, width, height)
+
+
+def get_many(thumbnail_files):
+    """Метаданные нескольких миниатюр по их ключам.
+
+    Для хранилища cached_db это один get_many кеша и один запрос к базе
+    на промахи вместо пары обращений на каждую миниатюру.
+    """
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBKVStore):
+        return {
+            image_file.key: kvstore.get(image_file)
+            for image_file in thumbnail_files
+        }
+    keys = {add_prefix(image_file.key): image_file.key
+            for image_file in thumbnail_files}
+    found = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        stored = dict(KVStoreModel.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        # Как и sorl, запоминаем отсутствие, чтобы не ходить в базу снова.
+        stored.update(
+            (key, EMPTY_VALUE) for key in missing if key not in stored)
+        kvstore.cache.set_many(stored, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        found.update(stored)
+    return {
+        keys[key]: deserialize_image_file(value)
+        for key, value in found.items() if value != EMPTY_VALUE
+    }
+
+
+def image_formats():
+    """Форматы вариантов, которые умеет сохранять текущая сборка Pillow.
+
+    Pillow без libwebp не пишет WebP, тогда остается только JPEG.
+    """
+    Image.init()
+    return [
+        image_format for image_format in settings.POST_IMAGE_FORMATS
+        if image_format in Image.SAVE
+    ]
+
+
+def variants():
+    """Все миниатюры картинки поста: имя -> (геометрия, параметры).
+
+    Варианты называются по геометрии и формату: 600x226.webp.
+    """
+    result = {}
+    aspect_width, aspect_height = settings.POST_IMAGE_ASPECT
+    for width in settings.POST_IMAGE_WIDTHS:
+        geometry = f'{width}x{round(width * aspect_height / aspect_width)}'
+        for image_format in image_formats():
+            result[f'{geometry}.{image_format.lower()}'] = (geometry, {
+                'crop': 'center', 'upscale': True, 'format': image_format,
+            })
+    return result
+
+
+def source(name):
+    """Картинка поста по имени из базы.
+
+    Ключи миниатюр sorl зависят от хранилища исходника, поэтому оно
+    берется у поля Post.image, а не хранилище sorl по умолчанию.
+    """
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def generate(file_, force=False):
+    """Создает все миниатюры картинки из одного ее декодирования."""
+    default.backend.get_thumbnails(file_, variants().values(), force=force)
+
+
+def refresh(*pks):
+    """Сбрасывает кеши карточек постов, у которых появились миниатюры.
+
+    Пока миниатюр нет, карточка показывает исходную картинку, и эта
+    разметка остается в кеше карточек, лент и страниц гостей.
+    """
+    if not pks:
+        return
+    Post.objects.filter(pk__in=pks).update(updated_at=timezone.now())
+    page_cache.invalidate(*(f'post:{pk}' for pk in pks))
+    bump_feed_version()
+
+
+def _generate(pk, name):
+    try:
+        generate(source(name))
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+    else:
+        refresh(pk)
+
+
+def _generate_in_background(pk, name):
+    try:
+        _generate(pk, name)
+    finally:
+        # У потока пула свое соединение с базой, держать его незачем.
+        connection.close()
+
+
+def queue(post):
+    """Ставит миниатюры картинки поста в очередь после коммита.
+
+    Без POST_THUMBNAILS_ASYNC миниатюры создаются сразу в on_commit:
+    тесты не оставляют после себя фоновых записей в MEDIA_ROOT.
+    """
+    if not post.image:
+        return
+    pk, name = post.pk, post.image.name
+    if settings.POST_THUMBNAILS_ASYNC:
+        transaction.on_commit(
+            lambda: executor.submit(_generate_in_background, pk, name))
+    else:
+        transaction.on_commit(lambda: _generate(pk, name))
+
+
+def prefetch(posts):
+    """Загружает миниатюры всех постов страницы одним обращением.
+
+    Результат кладется в post.prefetched_thumbnails, откуда его берут
+    тег {% post_picture %}.
+    """
+    wanted = []
+    for post in posts:
+        post.prefetched_thumbnails = {}
+        if not post.image:
+            continue
+        for name, (geometry, options) in variants().items():
+            _, thumbnail = default.backend.thumbnail_file(
+                post.image, geometry, **options)
+            wanted.append((post, name, thumbnail))
+    found = get_many([thumbnail for _, _, thumbnail in wanted])
+    for post, name, thumbnail in wanted:
+        post.prefetched_thumbnails[name] = found.get(thumbnail.key)
+
+
+def get_variants(file_, names):
+    """Миниатюры для шаблона по именам из variants().
+
+    Только читает метаданные: миниатюры создает очередь при сохранении
+    поста, а для картинок, загруженных раньше, — generate_thumbnails.
+    Недостающие миниатюры возвращаются как None.
+    """
+    all_variants = variants()
+    prefetched = getattr(getattr(file_, 'instance', None),
+                         'prefetched_thumbnails', {})
+    result = {}
+    for name in names:
+        if name in prefetched:
+            result[name] = prefetched[name]
+        else:
+            geometry, options = all_variants[name]
+            result[name] = default.backend.get_existing(
+                file_, geometry, **options)
+    return result
@@ -0,0 +1,187 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F
+
+from .models import Follow, Post, Timeline
+from .utils import feed_key, invalidate_feed_counts
+
+CELEBRITIES_KEY = 'timeline:celebrities'
+
+
+def recent_posts_key(author_id):
+    return f'timeline:recent:{author_id}'
+
+
+def celebrities():
+    """Авторы, чьи посты не раскладываются, а подмешиваются при чтении."""
+    authors = cache.get(CELEBRITIES_KEY)
+    if authors is None:
+        authors = frozenset(
+            Follow.objects.values('author').annotate(
+                followers=Count('pk')
+            ).filter(
+                followers__gte=settings.TIMELINE_FANOUT_LIMIT
+            ).values_list('author', flat=True)
+        )
+        cache.set(CELEBRITIES_KEY, authors, None)
+    return authors
+
+
+def recent_posts(author_ids):
+    """id свежих постов каждого автора из кеша, недостающие из базы."""
+    keys = {recent_posts_key(pk): pk for pk in author_ids}
+    cached = cache.get_many(keys)
+    post_ids = [pk for ids in cached.values() for pk in ids]
+    missing = {}
+    for key, author_id in keys.items():
+        if key not in cached:
+            missing[key] = list(
+                Post.objects.filter(author_id=author_id).values_list(
+                    'pk', flat=True)[:settings.TIMELINE_RECENT_POSTS]
+            )
+            post_ids += missing[key]
+    cache.set_many(missing, None)
+    return post_ids
+
+
+def invalidate_recent_posts(author_id):
+    cache.delete(recent_posts_key(author_id))
+
+
+def fan_out(post):
+    """Раскладывает новый пост в ленты всех подписчиков автора."""
+    if post.author_id in celebrities():
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    Timeline.objects.bulk_create(
+        (Timeline(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in followers.iterator()),
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user, author):
+    """Добавляет в ленту подписчика уже опубликованные посты автора."""
+    posts = Post.objects.filter(author=author).exclude(
+        timeline__user=user).values_list('pk', 'pub_date')
+    Timeline.objects.bulk_create(
+        (Timeline(user=user, post_id=pk, pub_date=pub_date)
+         for pk, pub_date in posts.iterator()),
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def prune(user, author):
+    """Убирает из ленты подписчика посты автора после отписки."""
+    Timeline.objects.filter(user=user, post__author=author).delete()
+
+
+def followers_changed(author):
+    """Переключает автора между раскладкой и подмешиванием по порогу.
+
+    Пока автор выше порога, его новые посты в ленты не пишутся, поэтому
+    при падении ниже порога ленты всех подписчиков дозаполняются.
+    """
+    followers = Follow.objects.filter(author=author)
+    is_celebrity = (
+        followers.count() >= settings.TIMELINE_FANOUT_LIMIT)
+    if is_celebrity == (author.pk in celebrities()):
+        return is_celebrity
+    cache.delete(CELEBRITIES_KEY)
+    if not is_celebrity:
+        feeds = []
+        for follow in followers.select_related('user').iterator():
+            backfill(follow.user, author)
+            feeds.append(feed_key('follow', follow.user_id))
+        invalidate_feed_counts(*feeds)
+    return is_celebrity
+
+
+class FollowFeed:
+    """Лента подписок, слитая из нескольких querysets.
+
+    Каждый queryset уже отсортирован по своему индексу, поэтому срез
+    [start:stop] берет из каждого не больше stop строк с LIMIT, а
+    страница собирается слиянием в Python. filter() и order_by()
+    применяются к каждому queryset — этого хватает обоим пагинаторам.
+    Querysets не должны пересекаться.
+    """
+
+    ordered = True
+
+    def __init__(self, *querysets, ordering=('-feed_date', '-feed_id')):
+        self.querysets = querysets
+        self.ordering = ordering
+
+    def filter(self, *args, **kwargs):
+        return FollowFeed(
+            *(queryset.filter(*args, **kwargs)
+              for queryset in self.querysets),
+            ordering=self.ordering,
+        )
+
+    def order_by(self, *ordering):
+        return FollowFeed(
+            *(queryset.order_by(*ordering) for queryset in self.querysets),
+            ordering=ordering,
+        )
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def exists(self):
+        return any(queryset.exists() for queryset in self.querysets)
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step:
+            raise TypeError('FollowFeed поддерживает только срезы.')
+        fields = [field.lstrip('-') for field in self.ordering]
+        merged = heapq.merge(
+            *(queryset.order_by(*self.ordering)[:key.stop]
+              for queryset in self.querysets),
+            key=lambda post: [getattr(post, field) for field in fields],
+            reverse=self.ordering[0].startswith('-'),
+        )
+        return list(islice(merged, key.start or 0, key.stop))
+
+
+def follow_feed(user):
+    """Лента подписок одним диапазонным чтением по (user, -pub_date).
+
+    Посты популярных авторов подмешиваются из кеша их свежих постов
+    отдельным запросом: OR двух условий заставил бы SQLite прочитать и
+    отсортировать всю ленту. Ключи сортировки feed_date и feed_id
+    берутся из строк ленты, чтобы и номерная, и курсорная пагинация
+    шли по индексу ленты.
+    """
+    posts = Post.objects.select_related('author', 'group')
+    pulled = celebrities()
+    if pulled:
+        pulled = Follow.objects.filter(
+            user=user, author_id__in=pulled).values_list(
+                'author_id', flat=True)
+    pulled_posts = recent_posts(set(pulled)) if pulled else []
+    timeline = posts.filter(timeline__user=user).annotate(
+        feed_date=F('timeline__pub_date'),
+        feed_id=F('timeline__post_id'),
+    )
+    if not pulled_posts:
+        return timeline.order_by('-feed_date', '-feed_id')
+    return FollowFeed(
+        # Старые посты популярного автора могли остаться в ленте.
+        timeline.exclude(pk__in=pulled_posts),
+        posts.filter(pk__in=pulled_posts).annotate(
+            feed_date=F('pub_date'), feed_id=F('pk')),
+    )
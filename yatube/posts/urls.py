@@ -6,14 +6,22 @@ app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('feed/', views.index_feed, name='index_feed'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
+    path('group/<slug:slug>/feed/', views.group_feed, name='group_feed'),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path('profile/<str:username>/feed/',
+         views.profile_feed, name='profile_feed'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('posts/<int:post_id>/comment/',
          views.add_comment, name='add_comment'),
+    path('posts/<int:post_id>/comments/',
+         views.post_comments, name='post_comments'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('follow/feed/', views.follow_feed_page, name='follow_feed'),
+    path('search/', views.search, name='search'),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
@@ -1,8 +1,291 @@
+import base64
+import binascii
+import time
+
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from core.page_cache import add_tags
+
+CURSOR_NEXT = 'n'
+CURSOR_PREVIOUS = 'p'
+FEED_VERSION_KEY = 'posts:feed_version'
+
+
+def encode_cursor(direction, post, date_attr='pub_date'):
+    """Упаковывает позицию (дата, id) в непрозрачный токен."""
+    raw = f'{direction}|{getattr(post, date_attr).isoformat()}|{post.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (direction, pub_date, id) или None для битого токена."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        direction, pub_date, pk = raw.split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        return None
+    if direction not in (CURSOR_NEXT, CURSOR_PREVIOUS) or pub_date is None:
+        return None
+    return direction, pub_date, pk
+
+
+class CursorPage(Page):
+    """Страница ленты без номера: ссылки строятся по курсорам."""
+
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, next_cursor=None,
+                 previous_cursor=None):
+        super().__init__(object_list, 1, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<Cursor page {self.previous_cursor}:{self.next_cursor}>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class CursorPaginator(Paginator):
+    """Keyset-пагинация по (pub_date, id) без COUNT(*) и OFFSET.
+
+    Стоимость любой страницы одинакова: один запрос
+    WHERE (pub_date, id) < (x, y) ORDER BY pub_date DESC, id DESC LIMIT n.
+    keys — поля сортировки в запросе, date_attr — атрибут строки с датой
+    для курсора.
+    """
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'pk'),
+                 date_attr='pub_date', **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.date_key, self.id_key = keys
+        self.date_attr = date_attr
+
+    def encode(self, direction, row):
+        return encode_cursor(direction, row, self.date_attr)
+
+    def after(self, pub_date, pk, lookup):
+        return (
+            Q(**{f'{self.date_key}__{lookup}': pub_date})
+            | Q(**{self.date_key: pub_date, f'{self.id_key}__{lookup}': pk})
+        )
+
+    def get_page(self, cursor):
+        decoded = decode_cursor(cursor) if cursor else None
+        posts = self.object_list.order_by(
+            f'-{self.date_key}', f'-{self.id_key}')
+        if decoded is None:
+            return self._page(posts, first=True)
+        direction, pub_date, pk = decoded
+        if direction == CURSOR_NEXT:
+            posts = posts.filter(self.after(pub_date, pk, 'lt'))
+            return self._page(posts, first=False)
+        rows = list(
+            self.object_list.filter(
+                self.after(pub_date, pk, 'gt')
+            ).order_by(self.date_key, self.id_key)[:self.per_page + 1]
+        )
+        if len(rows) <= self.per_page:
+            # Дошли до начала ленты: показываем первую страницу целиком.
+            return self._page(posts, first=True)
+        rows = rows[:self.per_page][::-1]
+        return CursorPage(
+            rows,
+            self,
+            next_cursor=self.encode(CURSOR_NEXT, rows[-1]),
+            previous_cursor=self.encode(CURSOR_PREVIOUS, rows[0]),
+        )
+
+    def _page(self, posts, first):
+        rows = list(posts[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        next_cursor = previous_cursor = None
+        if has_next:
+            next_cursor = self.encode(CURSOR_NEXT, rows[-1])
+        if not first and rows:
+            previous_cursor = self.encode(CURSOR_PREVIOUS, rows[0])
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+
+def paginator_comments(post, cursor=None):
+    """Страница комментариев поста, новые первыми, по индексу
+    (post, -created). Следующие страницы догружает post_comments.
+    """
+    paginator = CursorPaginator(
+        post.comments.select_related('author'),
+        settings.PAGINATOR_COMMENT_LIMIT,
+        keys=('created', 'pk'), date_attr='created',
+    )
+    return paginator.get_page(cursor)
+
+
+def feed_key(name, pk=None):
+    """Имя ленты: index, group:<id>, author:<id>, follow:<id>."""
+    return name if pk is None else f'{name}:{pk}'
+
+
+def feed_count_cache_key(feed):
+    return f'posts:count:{feed}'
+
+
+class CachedCountPaginator(Paginator):
+    """Пагинатор с закешированным COUNT(*) и сжатым списком страниц.
+
+    Счетчик ленты сбрасывается сигналами posts.signals при сохранении
+    и удалении постов, а таймаут страхует от пропущенного сброса.
+    """
+
+    ELLIPSIS = '…'
+    on_each_side = 2
+    on_ends = 1
+
+    def __init__(self, object_list, per_page, feed=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.feed = feed
+        self.elided_page_range = []
+
+    @cached_property
+    def count(self):
+        if self.feed is None:
+            return super().count
+        key = feed_count_cache_key(self.feed)
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, settings.PAGINATOR_COUNT_TIMEOUT)
+        return count
+
+    def get_page(self, number):
+        page = super().get_page(number)
+        self.elided_page_range = list(
+            self.get_elided_page_range(page.number))
+        return page
+
+    def get_elided_page_range(self, number):
+        """Номера страниц вокруг текущей и по краям, с многоточиями."""
+        window = self.on_each_side + self.on_ends
+        if self.num_pages <= window * 2:
+            yield from self.page_range
+            return
+        if number > window + 2:
+            yield from range(1, self.on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - self.on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < self.num_pages - window - 1:
+            yield from range(number + 1, number + self.on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(
+                self.num_pages - self.on_ends + 1, self.num_pages + 1)
+        else:
+            yield from range(number + 1, self.num_pages + 1)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор админки без COUNT(*) по всей большой таблице.
+
+    Число строк без фильтров берется из кеша и обновляется раз
+    в ADMIN_COUNT_TIMEOUT. Выборку с фильтрами или поиском считаем не
+    дальше ADMIN_COUNT_LIMIT строк: страницы за этой границей не видны,
+    зато запрос не просматривает всю таблицу.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        if queryset.query.where:
+            return queryset[:settings.ADMIN_COUNT_LIMIT].count()
+        key = f'admin:count:{queryset.model._meta.label_lower}'
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, settings.ADMIN_COUNT_TIMEOUT)
+        return count
+
+
+def invalidate_feed_counts(*feeds):
+    cache.delete_many([feed_count_cache_key(feed) for feed in feeds])
+
+
+def feed_version():
+    """Версия контента лент, входит в ключи кеша фрагментов."""
+    version = cache.get(FEED_VERSION_KEY)
+    if version is None:
+        # Начинаем не с единицы: после вытеснения ключа версия не должна
+        # совпасть со старой, иначе всплывут устаревшие фрагменты.
+        cache.add(FEED_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(FEED_VERSION_KEY)
+    return version
+
+
+def feed_page_key(request, *args, **kwargs):
+    """Ключ страницы ленты для single_flight_cache_page.
+
+    Версия лент в ключе: после правки постов страница строится заново,
+    а не ждет конца срока.
+    """
+    return request.get_full_path(), request.user.pk, feed_version()
+
+
+def bump_feed_version():
+    try:
+        cache.incr(FEED_VERSION_KEY)
+    except ValueError:
+        feed_version()
+
+
+def post_tags(post):
+    """Метки страничного кеша, от которых зависит карточка поста."""
+    tags = [f'post:{post.pk}', f'user:{post.author_id}']
+    if post.group_id:
+        tags.append(f'group:{post.group_id}')
+    return tags
+
+
+def tag_page(request, *tags, posts=()):
+    """Помечает страницу для кеша анонимов; остальным метки не нужны."""
+    if request.user.is_authenticated:
+        return
+    add_tags(request, *tags, *(
+        tag for post in posts for tag in post_tags(post)))
+
+
+def paginator_cursor(request, posts, cursor_keys=('pub_date', 'pk')):
+    paginator = CursorPaginator(
+        posts, settings.PAGINATOR_POST_LIMIT, keys=cursor_keys)
+    return paginator.get_page(request.GET.get('cursor'))
+
+
+def next_cursor(page_obj):
+    """Курсор страницы, следующей за page_obj, курсорной или номерной.
+
+    Устаревший счетчик ленты может обещать следующую страницу и у пустой.
+    """
+    if not page_obj.has_next() or not page_obj:
+        return None
+    if getattr(page_obj, 'is_cursor', False):
+        return page_obj.next_cursor
+    return encode_cursor(CURSOR_NEXT, page_obj[-1])
 
 
-def paginator_posts(request, posts):
-    paginator = Paginator(posts, settings.PAGINATOR_POST_LIMIT)
+def paginator_posts(request, posts, feed=None, cursor_keys=('pub_date', 'pk')):
+    if 'cursor' in request.GET:
+        return paginator_cursor(request, posts, cursor_keys)
+    paginator = CachedCountPaginator(
+        posts, settings.PAGINATOR_POST_LIMIT, feed=feed)
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
@@ -1,27 +1,63 @@
+from urllib.parse import urlencode
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 from django.shortcuts import get_object_or_404, render
 from django.shortcuts import redirect
-# from django.views.decorators.cache import cache_page
+from django.views.decorators.http import etag
+
+from core.stampede import single_flight_cache_page
 
+from . import conditional, thumbnails
 from .models import Group, Follow, Post, User
 from .forms import PostForm, CommentForm
-from .utils import paginator_posts
+from .search import SearchResults
+from .timeline import follow_feed
+from .utils import (
+    CachedCountPaginator, feed_key, feed_page_key, paginator_comments,
+    paginator_cursor, paginator_posts, tag_page,
+)
+
+FEED_PAGE_TEMPLATE = 'posts/includes/feed_page.html'
+
+
+def render_feed_page(request, page_obj, **context):
+    """Страница ленты для догрузки: только карточки и ссылка дальше."""
+    context.update(page_obj=page_obj, feed_url=request.path)
+    return render(request, FEED_PAGE_TEMPLATE, context)
 
 
-# @cache_page(60 * 20)
+@etag(conditional.index_etag)
+@single_flight_cache_page(settings.FEED_CACHE_TIMEOUT, key_func=feed_page_key)
 def index(request):
     posts = Post.objects.select_related('author', 'group').all()
-    page_obj = paginator_posts(request, posts)
+    page_obj = paginator_posts(request, posts, feed_key('index'))
+    tag_page(request, f"feed:{feed_key('index')}", posts=page_obj)
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/index.html', context)
 
 
+@etag(conditional.index_etag)
+def index_feed(request):
+    posts = Post.objects.select_related('author', 'group').all()
+    page_obj = paginator_cursor(request, posts)
+    tag_page(request, f"feed:{feed_key('index')}", posts=page_obj)
+    return render_feed_page(request, page_obj)
+
+
+@etag(conditional.group_etag)
+@single_flight_cache_page(settings.FEED_CACHE_TIMEOUT, key_func=feed_page_key)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('author').all()
-    page_obj = paginator_posts(request, posts)
+    posts = group.posts.select_related('author', 'group').all()
+    page_obj = paginator_posts(request, posts, feed_key('group', group.pk))
+    tag_page(
+        request, f'group:{group.pk}', f"feed:{feed_key('group', group.pk)}",
+        posts=page_obj
+    )
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -29,10 +65,29 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@etag(conditional.group_etag)
+def group_feed(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    posts = group.posts.select_related('author', 'group').all()
+    page_obj = paginator_cursor(request, posts)
+    tag_page(
+        request, f'group:{group.pk}', f"feed:{feed_key('group', group.pk)}",
+        posts=page_obj
+    )
+    return render_feed_page(request, page_obj, group=group)
+
+
+@etag(conditional.profile_etag)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
     author_posts = author.posts.select_related('group').all()
-    page_obj = paginator_posts(request, author_posts)
+    page_obj = paginator_posts(
+        request, author_posts, feed_key('author', author.pk))
+    tag_page(
+        request, f'user:{author.pk}', f"feed:{feed_key('author', author.pk)}",
+        posts=page_obj
+    )
     following = (request.user.is_authenticated
                  and author.following.filter(user=request.user).exists())
     context = {
@@ -43,14 +98,30 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+@etag(conditional.profile_etag)
+def profile_feed(request, username):
+    author = get_object_or_404(User, username=username)
+    posts = author.posts.select_related('group').all()
+    page_obj = paginator_cursor(request, posts)
+    tag_page(
+        request, f'user:{author.pk}', f"feed:{feed_key('author', author.pk)}",
+        posts=page_obj
+    )
+    return render_feed_page(request, page_obj, author=author)
+
+
+@etag(conditional.post_etag)
 def post_detail(request, post_id):
     post = get_object_or_404(
-        Post.objects.select_related('author').prefetch_related(
-            'comments__author'),
-        id=post_id
-    )
+        Post.objects.select_related('author__stats', 'group'), id=post_id)
     form = CommentForm(request.POST or None)
-    comments = post.comments.all()
+    comments = paginator_comments(post)
+    tag_page(
+        request, f'comments:{post.pk}',
+        f"feed:{feed_key('author', post.author_id)}",
+        *(f'user:{comment.author_id}' for comment in comments),
+        posts=(post,)
+    )
     context = {
         'post': post,
         'form': form,
@@ -59,18 +130,37 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+@etag(conditional.post_etag)
+def post_comments(request, post_id):
+    """Следующая страница комментариев поста без обвязки страницы."""
+    post = get_object_or_404(Post.objects.only('pk'), id=post_id)
+    comments = paginator_comments(post, request.GET.get('cursor'))
+    tag_page(
+        request, f'comments:{post.pk}',
+        *(f'user:{comment.author_id}' for comment in comments),
+    )
+    context = {
+        'post': post,
+        'comments': comments,
+    }
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
 @login_required
+@transaction.atomic
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        thumbnails.queue(post)
         return redirect('posts:profile', username=post.author.username)
     return render(request, 'posts/post_create.html', {'form': form})
 
 
 @login_required
+@transaction.atomic
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     if post.author != request.user:
@@ -82,11 +172,14 @@ def post_edit(request, post_id):
     )
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            thumbnails.queue(post)
         return redirect('posts:post_detail', post_id)
     return render(request, 'posts/post_create.html', {'form': form})
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -101,9 +194,10 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.select_related(
-        'author', 'group').filter(author__following__user=request.user)
-    page_obj = paginator_posts(request, posts)
+    posts = follow_feed(request.user)
+    page_obj = paginator_posts(
+        request, posts, feed_key('follow', request.user.pk),
+        cursor_keys=('feed_date', 'feed_id'))
     context = {
         'page_obj': page_obj,
     }
@@ -111,6 +205,29 @@ def follow_index(request):
 
 
 @login_required
+def follow_feed_page(request):
+    page_obj = paginator_cursor(
+        request, follow_feed(request.user),
+        cursor_keys=('feed_date', 'feed_id'))
+    return render_feed_page(request, page_obj)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    # Сортировка по релевантности курсоров по дате не допускает.
+    paginator = CachedCountPaginator(
+        SearchResults(query), settings.PAGINATOR_POST_LIMIT)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'query_string': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if request.user != author:
@@ -119,6 +236,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     Follow.objects.filter(
         author__username=username, user=request.user).delete()
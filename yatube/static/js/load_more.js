@@ -0,0 +1,69 @@
+// Ссылки с data-load-more догружают следующую страницу на место себя:
+// фрагмент с сервера содержит новые записи и ссылку на следующую страницу.
+// Фрагмент берется из значения data-load-more, а без него — из href,
+// так что без скрипта ссылка ведет на обычную страницу. Ссылки
+// с data-infinite срабатывают сами, когда до них докрутили ленту.
+(function () {
+  'use strict';
+
+  var observer = null;
+  if ('IntersectionObserver' in window) {
+    observer = new IntersectionObserver(function (entries) {
+      entries.forEach(function (entry) {
+        if (entry.isIntersecting) {
+          observer.unobserve(entry.target);
+          loadMore(entry.target);
+        }
+      });
+    }, {rootMargin: '600px 0px'});
+  }
+
+  function watch(links) {
+    if (!observer) {
+      return;
+    }
+    Array.prototype.forEach.call(links, function (link) {
+      observer.observe(link);
+    });
+  }
+
+  function loadMore(link) {
+    if (link.dataset.loading) {
+      return;
+    }
+    link.dataset.loading = 'true';
+    fetch(link.dataset.loadMore || link.href, {credentials: 'same-origin'})
+      .then(function (response) {
+        if (!response.ok) {
+          throw new Error(response.status);
+        }
+        return response.text();
+      })
+      .then(function (html) {
+        var template = document.createElement('template');
+        template.innerHTML = html;
+        var links = template.content.querySelectorAll('[data-infinite]');
+        link.replaceWith(template.content);
+        // Номера страниц после догрузки уже не соответствуют ленте.
+        document.querySelectorAll('[data-pagination]').forEach(
+          function (nav) {
+            nav.remove();
+          });
+        watch(links);
+      })
+      .catch(function () {
+        // Повтор — по клику, чтобы не долбить сервер при ошибке.
+        delete link.dataset.loading;
+      });
+  }
+
+  document.addEventListener('click', function (event) {
+    var link = event.target.closest('[data-load-more]');
+    if (link) {
+      event.preventDefault();
+      loadMore(link);
+    }
+  });
+
+  watch(document.querySelectorAll('[data-infinite]'));
+})();
@@ -31,12 +31,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.AnonymousPageCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -54,6 +56,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'core.context_processors.year.year',
+                'core.context_processors.feed_cache.feed_cache',
             ],
         },
     },
@@ -102,11 +105,27 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 
 LIMIT_POSTS = 10
-LIMIT_TEXT_MODEL = 15
 LIMIT_TEXT = 30
 PAGINATOR_POST_CREATE = 13
 PAGINATOR_POST_LIMIT = 10
+PAGINATOR_COMMENT_LIMIT = 20
 PAGINATOR_POST_TEST = 3
+PAGINATOR_COUNT_TIMEOUT = 60 * 60
+# Админка не считает строки дальше ADMIN_COUNT_LIMIT, а число всех строк
+# таблицы кеширует на ADMIN_COUNT_TIMEOUT.
+ADMIN_COUNT_LIMIT = 10000
+ADMIN_COUNT_TIMEOUT = 60 * 5
+# Длина фрагмента текста в результатах поиска, в словах.
+SEARCH_SNIPPET_WORDS = 24
+TIMELINE_BATCH_SIZE = 500
+TIMELINE_FANOUT_LIMIT = 1000
+TIMELINE_RECENT_POSTS = 100
+FEED_CACHE_TIMEOUT = 60 * 60 * 12
+STAMPEDE_BETA = 1.0
+STAMPEDE_GRACE = 60 * 5
+STAMPEDE_LOCK_TIMEOUT = 30
+STAMPEDE_WAIT = 2
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
 
 
 LOGIN_URL = 'users:login'
@@ -116,11 +135,44 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
-
+# Отдачу медиа можно передать веб-серверу: 'X-Accel-Redirect' для nginx
+# (внутренний location с префиксом MEDIA_ACCEL_REDIRECT_PREFIX и alias на
+# MEDIA_ROOT) или 'X-Sendfile' для Apache и lighttpd. None — отдает Django.
+MEDIA_SENDFILE_HEADER = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+MEDIA_MAX_AGE = 60 * 60
+# Файлы с хешем в имени не меняются, их кешируют навсегда.
+MEDIA_IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+THUMBNAIL_BACKEND = 'posts.thumbnails.PostThumbnailBackend'
+THUMBNAIL_ENGINE = 'posts.thumbnails.DraftEngine'
+# Адаптивные варианты картинки поста: ширины с пропорциями ASPECT
+# в каждом из форматов. JPEG обязателен, он же запасной вариант.
+POST_IMAGE_ASPECT = (900, 339)
+POST_IMAGE_WIDTHS = (360, 600, 900)
+POST_IMAGE_FORMATS = ('WEBP', 'JPEG')
+POST_IMAGE_SIZES = '(max-width: 900px) 100vw, 900px'
+THUMBNAIL_WORKERS = 2
+# Миниатюры новых картинок создаются в фоновых потоках после коммита.
+POST_THUMBNAILS_ASYNC = True
+# Загруженные картинки постов ужимаются до этих размеров и качества.
+POST_IMAGE_MAX_SIZE = (2560, 2560)
+POST_IMAGE_QUALITY = 85
+POST_IMAGE_REENCODE_SIZE = 1024 * 1024
+
+CACHE_DIR = os.path.join(BASE_DIR, 'cache')
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(CACHE_DIR, 'default.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'MAX_SIZE': 256 * 1024 * 1024,
+        },
     }
 }
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
+
+# Тесты чистят кеш, поэтому работают со своим файлом, а не с кешем сайта.
+TEST_RUNNER = 'core.runner.TestRunner'